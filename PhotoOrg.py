@@ -4,30 +4,32 @@ Photo and Video Organizer with Parallel Processing - v1.3.3 (Definitivo)
 Organizza foto e video con processing parallelo multi-thread
 """
 
-from typing import Dict, Optional, Any
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Any, Tuple
 from config.config_loader import ConfigLoader
 from loggingSetup.logging_setup import LoggingSetup
-from database.database_manager import DatabaseManager
-from processing.file_processor import FileProcessor
+from processing.file_utils import COPY_STRATEGIES, cached_stat, clear_stat_cache, get_executor, usable_cpu_count
 from pathlib import Path
+from types import SimpleNamespace
+import stat
 import sys
 import logging
-import shutil
 import time
 import os
-import argparse
-import traceback
 
+# DatabaseManager, FileProcessor e FilePipeline (sqlite3, PIL, tqdm, GExiv2...) sono importati
+# nelle funzioni che li usano: --help, --version e --reset non pagano il loro caricamento.
+if TYPE_CHECKING:
+    from database.database_manager import DatabaseManager
+    from processing.file_processor import FileProcessor
 
-def setup_minimal_logging():
+
+def setup_minimal_logging(verbose: bool = False):
     """
     Configura logging solo su file, console pulita per utente.
+    I record vengono accodati e scritti dal QueueListener avviato in initialize_logging.
+    Con verbose=True vengono registrati anche i messaggi DEBUG per singolo file.
     """
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - [%(threadName)s] - %(message)s",
-        handlers=[]
-    )
+    LoggingSetup.setup_queue_handler(logging.DEBUG if verbose else logging.INFO)
 
 
 def validate_config(config: Dict[str, Any]) -> None:
@@ -43,14 +45,49 @@ def validate_config(config: Dict[str, Any]) -> None:
     if missing_keys:
         raise ValueError(f"Chiavi di configurazione mancanti: {', '.join(missing_keys)}")
     
+    copy_strategy = config.get("copy_config", {}).get("strategy", "sendfile")
+    if copy_strategy not in COPY_STRATEGIES:
+        raise ValueError(f"copy_config.strategy non valido: '{copy_strategy}' (valori ammessi: {', '.join(COPY_STRATEGIES)})")
+    
+    # Risolti una sola volta: le funzioni a valle usano le chiavi interne _resolved_*
     source_path = Path(config["source"]).resolve()
-    if not source_path.exists():
+    dest_path = Path(config["destination"]).resolve()
+    # Una sola stat per path, riusata dai controlli e da create_destination_directory
+    source_stat = _stat_or_none(source_path)
+    dest_stat = _stat_or_none(dest_path)
+    _validate_paths(source_path, dest_path, source_stat, dest_stat)
+    
+    config["_resolved_source"] = source_path
+    config["_resolved_destination"] = dest_path
+    config["_destination_stat"] = dest_stat
+    
+    print("[SUCCESS] Configurazione validata con successo (incluse opzioni parallelismo e sicurezza path)")
+
+
+def _stat_or_none(path: Path) -> Optional[os.stat_result]:
+    """os.stat non memoizzata; None se il path non esiste."""
+    try:
+        return os.stat(path)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def _validate_paths(source_path: Path, dest_path: Path,
+                    source_stat: Optional[os.stat_result], dest_stat: Optional[os.stat_result]) -> None:
+    """Controlli su esistenza di sorgente/destinazione (già risolte e con stat già letta) e sul loro contenimento reciproco."""
+    if source_stat is None:
         raise ValueError(f"Directory sorgente non trovata: {source_path}")
     
-    if not source_path.is_dir():
+    if not stat.S_ISDIR(source_stat.st_mode):
         raise ValueError(f"Il percorso sorgente non è una directory: {source_path}")
-    
-    dest_path = Path(config["destination"]).resolve()
+
+    # Verifica di leggibilità: legge al più una voce, senza materializzare l'elenco della directory
+    try:
+        with os.scandir(source_path) as entries:
+            next(entries, None)
+    except PermissionError:
+        raise ValueError(f"Directory sorgente non leggibile (permessi insufficienti): {source_path}")
+
     if source_path == dest_path:
         raise ValueError(
             f"ERRORE CRITICO: Directory sorgente e destinazione sono identiche!\n"
@@ -59,34 +96,45 @@ def validate_config(config: Dict[str, Any]) -> None:
             f"Questo potrebbe causare perdita di dati. Specificare una destinazione diversa."
         )
     
-    try:
-        dest_path.relative_to(source_path)
+    source_str, dest_str = str(source_path), str(dest_path)
+    common_path = os.path.commonpath([source_str, dest_str])
+    
+    if common_path == source_str:
         raise ValueError(
             f"ERRORE CRITICO: La destinazione è una sottodirectory della sorgente!\n"
             f"Sorgente: {source_path}\n"
             f"Destinazione: {dest_path}\n"
             f"Questo potrebbe causare perdita di dati o loop infiniti."
         )
-    except ValueError as e:
-        if "ERRORE CRITICO" in str(e):
-            raise
-        pass
-    
-    if dest_path.exists():
-        try:
-            source_path.relative_to(dest_path)
-            raise ValueError(
-                f"ERRORE CRITICO: La sorgente è una sottodirectory della destinazione!\n"
-                f"Sorgente: {source_path}\n"
-                f"Destinazione: {dest_path}\n"
-                f"Configurazione non valida."
-            )
-        except ValueError as e:
-            if "ERRORE CRITICO" in str(e):
-                raise
-            pass
     
-    print("[SUCCESS] Configurazione validata con successo (incluse opzioni parallelismo e sicurezza path)")
+    if common_path == dest_str and dest_stat is not None:
+        raise ValueError(
+            f"ERRORE CRITICO: La sorgente è una sottodirectory della destinazione!\n"
+            f"Sorgente: {source_path}\n"
+            f"Destinazione: {dest_path}\n"
+            f"Configurazione non valida."
+        )
+
+    # Verifica di scrivibilità: se la destinazione non esiste ancora conta il primo antenato esistente
+    if dest_stat is not None:
+        if not stat.S_ISDIR(dest_stat.st_mode):
+            raise ValueError(f"Il percorso destinazione non è una directory: {dest_path}")
+        writable_dir = dest_path
+    else:
+        writable_dir = next((p for p in dest_path.parents if p.exists()), dest_path.anchor)
+    if not os.access(writable_dir, os.W_OK | os.X_OK):
+        raise ValueError(f"Directory destinazione non scrivibile (permessi insufficienti): {writable_dir}")
+
+
+def normalize_extensions(config: Dict[str, Any]) -> None:
+    """
+    Converte le liste di estensioni in frozenset minuscoli con punto iniziale,
+    così il test di appartenenza per ogni file è O(1).
+    """
+    for ext_key in ("supported_extensions", "image_extensions", "video_extensions"):
+        config[ext_key] = frozenset(
+            (ext if ext.startswith(".") else f".{ext}").lower() for ext in config[ext_key]
+        )
 
 
 def determine_worker_count(config: Dict[str, Any]) -> int:
@@ -98,7 +146,19 @@ def determine_worker_count(config: Dict[str, Any]) -> int:
     if parallel_config.get("max_workers") is not None:
         return parallel_config["max_workers"]
     
-    cpu_count = os.cpu_count() or 4
+    cpu_count = usable_cpu_count()
+    
+    if parallel_config.get("workload", "cpu") == "io":
+        # Carico I/O-bound (hash + stat + copia): i thread passano la maggior parte
+        # del tempo in attesa del disco, quindi un pool ampio costa poca memoria
+        # e maschera la latenza di lettura.
+        io_floor = parallel_config.get("io_worker_floor", 32)
+        max_limit = parallel_config.get("max_workers_limit", 64)
+        optimal_workers = min(max_limit, max(cpu_count * 4, io_floor))
+        print(f"[IO] Auto-detection worker (workload I/O-bound): CPU={cpu_count}, floor={io_floor}, "
+              f"limite={max_limit}, risultato={optimal_workers} (thread in attesa di I/O, overhead memoria trascurabile)")
+        return optimal_workers
+    
     cpu_multiplier = parallel_config.get("cpu_multiplier", 2)
     max_limit = parallel_config.get("max_workers_limit", 16)
     
@@ -108,12 +168,48 @@ def determine_worker_count(config: Dict[str, Any]) -> int:
     return optimal_workers
 
 
-def create_destination_directory(dest_dir: Path, dry_run: bool = False) -> bool:
+class WorkerConfig(NamedTuple):
+    """Dimensioni dei pool: io_workers per scansione, copia e preload; cpu_workers per hash ed EXIF."""
+    io_workers: int
+    cpu_workers: int
+
+
+def determine_worker_config(config: Dict[str, Any]) -> WorkerConfig:
+    """
+    Separa i pool per le due fasi: la parte I/O-bound usa determine_worker_count,
+    la parte CPU-bound (hash + metadati) parallelismo pari ai core, oltre il quale
+    i thread si contendono solo la CPU.
+    """
+    io_workers = determine_worker_count(config)
+    cpu_workers = config.get("parallel_processing", {}).get("cpu_workers") or usable_cpu_count()
+    print(f"[CPU] Worker hash/metadati: {cpu_workers}")
+    return WorkerConfig(io_workers=io_workers, cpu_workers=cpu_workers)
+
+
+def confirm(message: str, assume_yes: bool = False) -> bool:
+    """
+    Chiede conferma all'utente ([s/N]); con assume_yes=True risponde sì senza leggere lo stdin.
+    Senza terminale (EOF) la risposta è no.
+    """
+    if assume_yes:
+        print(f"{message} [s/N]: s (--yes)")
+        return True
+    try:
+        return input(f"{message} [s/N]: ").strip().lower() == "s"
+    except EOFError:
+        return False
+
+
+def create_destination_directory(dest_dir: Path, dry_run: bool = False, assume_yes: bool = False,
+                                 dest_stat: Optional[os.stat_result] = None) -> bool:
     """
     Gestisce la creazione della directory di destinazione con gestione errori robusta.
+    dest_stat è la stat già letta da validate_config; se assente viene letta qui.
     """
-    if dest_dir.exists():
-        if not dest_dir.is_dir():
+    if dest_stat is None:
+        dest_stat = cached_stat(str(dest_dir))
+    if dest_stat is not None:
+        if not stat.S_ISDIR(dest_stat.st_mode):
             logging.error(f"Il percorso di destinazione esiste ma non è una directory: {dest_dir}")
             print(f"[ERROR] '{dest_dir}' esiste ma non è una directory.")
             return False
@@ -126,9 +222,9 @@ def create_destination_directory(dest_dir: Path, dry_run: bool = False) -> bool:
             logging.info(f"[DRY-RUN] Simulazione creazione directory: {dest_dir}")
             return True
         
-        response = input(f"La directory di destinazione '{dest_dir}' non esiste. Vuoi crearla? [s/N]: ").strip().lower()
-        if response == "s":
-            dest_dir.mkdir(parents=True, exist_ok=True)
+        if confirm(f"La directory di destinazione '{dest_dir}' non esiste. Vuoi crearla?", assume_yes):
+            os.makedirs(dest_dir, exist_ok=True)
+            clear_stat_cache()
             logging.info(f"Directory '{dest_dir}' creata con successo")
             print(f"[SUCCESS] Directory '{dest_dir}' creata con successo.")
             return True
@@ -143,9 +239,169 @@ def create_destination_directory(dest_dir: Path, dry_run: bool = False) -> bool:
         return False
 
 
-def reset_environment(database_path: str, log_path: str, dest_dir: str) -> None:
+def _unlink_quiet(path: str) -> None:
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _fast_rmtree(root: str) -> None:
+    """
+    Elimina un albero usando il tipo restituito da os.scandir (nessuna lstat per voce):
+    prima tutti i file, poi le directory dalla più profonda.
+    """
+    directories = [root]
+    pending = [root]
+    while pending:
+        with os.scandir(pending.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                    directories.append(entry.path)
+                else:
+                    _unlink_quiet(entry.path)
+    for directory in reversed(directories):
+        os.rmdir(directory)
+
+
+def _parallel_rmtree(roots: List[Path], workers: int) -> Dict[Path, Exception]:
+    """
+    Elimina più alberi di directory su un unico pool di thread: ogni sottocartella di primo
+    livello (_fast_rmtree) e ogni file in radice è un task indipendente, così scansione e
+    unlink procedono in parallelo tra anni/mesi e tra cartelle diverse.
+    Le radici vengono rimosse alla fine; ritorna gli errori per radice.
+    """
+    from concurrent.futures import as_completed
+    
+    errors: Dict[Path, Exception] = {}
+    executor = get_executor(workers)
+    future_to_root = {}
+    for root in roots:
+        try:
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    task = _fast_rmtree if entry.is_dir(follow_symlinks=False) else _unlink_quiet
+                    future_to_root[executor.submit(task, entry.path)] = root
+        except OSError as e:
+            errors[root] = e
+    
+    for future in as_completed(future_to_root):
+        root = future_to_root[future]
+        try:
+            future.result()
+        except Exception as e:
+            errors.setdefault(root, e)
+    
+    for root in roots:
+        if root in errors:
+            continue
+        try:
+            os.rmdir(root)
+        except OSError as e:
+            errors[root] = e
+    return errors
+
+
+_NETWORK_FS_TYPES = frozenset({"nfs", "nfs4", "cifs", "smb3", "smbfs", "fuse.sshfs", "9p", "afs", "ceph", "glusterfs"})
+
+
+def _is_network_filesystem(path: Path) -> bool:
+    """True se il path si trova su un mount di rete (da /proc/self/mounts, solo Linux)."""
+    try:
+        with open("/proc/self/mounts", encoding="utf-8") as mounts:
+            entries = [line.split()[1:3] for line in mounts]
+    except OSError:
+        return False
+    
+    path_str = str(path)
+    best_mount, best_type = "", ""
+    for mount_point, fs_type in entries:
+        mount_point = mount_point.replace("\\040", " ")
+        if os.path.commonpath([path_str, mount_point]) == mount_point and len(mount_point) > len(best_mount):
+            best_mount, best_type = mount_point, fs_type
+    return best_type in _NETWORK_FS_TYPES
+
+
+def _walk_stat(root: str) -> int:
+    """Visita un sottoalbero chiamando stat su ogni voce; ritorna il numero di voci visitate."""
+    count = 0
+    pending = [root]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        entry.stat(follow_symlinks=False)
+                        if entry.is_dir(follow_symlinks=False):
+                            pending.append(entry.path)
+                    except OSError:
+                        pass
+                    count += 1
+        except OSError:
+            pass
+    return count
+
+
+def preload_metadata(source: Path, workers: int) -> None:
+    """
+    Pre-carica in parallelo i metadati (stat) dell'albero sorgente: su NFS/SMB la latenza
+    di ogni stat viene sovrapposta tra i thread e la scansione successiva trova la cache calda.
+    """
+    start = time.time()
+    try:
+        with os.scandir(source) as entries:
+            subdirs = [entry.path for entry in entries if entry.is_dir(follow_symlinks=False)]
+    except OSError as e:
+        logging.warning(f"Preload metadati saltato: {e}")
+        return
+    
+    total = sum(get_executor(workers).map(_walk_stat, subdirs))
+    
+    elapsed = time.time() - start
+    logging.info(f"Preload metadati: {total} voci in {len(subdirs)} sottocartelle, {elapsed:.2f}s")
+    print(f"[PRELOAD] Metadati pre-caricati: {total} voci in {elapsed:.1f}s")
+
+
+def should_preload_metadata(config: Dict[str, Any]) -> bool:
+    """preload_metadata: true/false esplicito, oppure "auto" (default) = solo su filesystem di rete."""
+    setting = config.get("parallel_processing", {}).get("preload_metadata", "auto")
+    if setting == "auto":
+        return _is_network_filesystem(config["_resolved_source"])
+    return bool(setting)
+
+
+def _is_rotational_device(path: Path) -> bool:
+    """True se il path si trova su un disco rotativo (da /sys/dev/block, solo Linux)."""
+    try:
+        dev = os.stat(path).st_dev
+    except OSError:
+        return False
+    block = f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}"
+    # Per una partizione l'attributo queue/rotational sta nel disco padre
+    for device_dir in (block, os.path.join(block, "..")):
+        try:
+            with open(os.path.join(device_dir, "queue", "rotational"), encoding="ascii") as f:
+                return f.read().strip() == "1"
+        except OSError:
+            continue
+    return False
+
+
+def should_serialize_reads(config: Dict[str, Any]) -> bool:
+    """serialize_reads: true/false esplicito, oppure "auto" (default) = solo se la sorgente è su disco rotativo."""
+    setting = config.get("performance_config", {}).get("serialize_reads", "auto")
+    if setting == "auto":
+        return _is_rotational_device(config["_resolved_source"])
+    return bool(setting)
+
+
+def reset_environment(database_path: str, log_path: str, dest_dir: Path, parallel: bool = False,
+                      assume_yes: bool = False) -> None:
     """
     Ripristina l'ambiente eliminando il database, i log e le directory di destinazione.
+    Con parallel=True le cartelle vengono eliminate insieme da _parallel_rmtree invece che una alla volta con _fast_rmtree.
     """
     print("[RESET] ATTENZIONE: Procedura di Reset dell'Ambiente")
     print("Questa operazione eliminerà:")
@@ -154,8 +410,7 @@ def reset_environment(database_path: str, log_path: str, dest_dir: str) -> None:
     print(f"  - Directory: {dest_dir}/PHOTO, {dest_dir}/VIDEO, etc.")
     
     try:
-        response = input("Sei sicuro di voler procedere? [s/N]: ").strip().lower()
-        if response != "s":
+        if not confirm("Sei sicuro di voler procedere?", assume_yes):
             print("[INFO] Reset annullato.")
             return
     except KeyboardInterrupt:
@@ -167,43 +422,77 @@ def reset_environment(database_path: str, log_path: str, dest_dir: str) -> None:
     paths_to_remove = [Path(database_path), Path(log_path)]
     folders_to_remove = ["PHOTO", "VIDEO", "PHOTO_DUPLICATES", "VIDEO_DUPLICATES", "ToReview"]
     for folder in folders_to_remove:
-        paths_to_remove.append(Path(dest_dir) / folder)
+        paths_to_remove.append(dest_dir / folder)
 
+    parallel_dirs = []
     for path in paths_to_remove:
         try:
-            if not path.exists():
+            path_stat = cached_stat(str(path))
+            if path_stat is None:
                 print(f"[INFO] Path non trovato, ignorato: {path}")
                 continue
-            if path.is_file():
+            if stat.S_ISREG(path_stat.st_mode):
                 path.unlink()
                 print(f"[SUCCESS] File eliminato: {path}")
-            elif path.is_dir():
-                shutil.rmtree(path)
+            elif stat.S_ISDIR(path_stat.st_mode):
+                if parallel:
+                    parallel_dirs.append(path)
+                    continue
+                _fast_rmtree(str(path))
                 print(f"[SUCCESS] Cartella eliminata: {path}")
         except Exception as e:
             print(f"[ERROR] Errore eliminando '{path}': {e}")
     
+    if parallel_dirs:
+        errors = _parallel_rmtree(parallel_dirs, workers=min(32, usable_cpu_count() * 4))
+        for path in parallel_dirs:
+            if path in errors:
+                print(f"[ERROR] Errore eliminando '{path}': {errors[path]}")
+            else:
+                print(f"[SUCCESS] Cartella eliminata: {path}")
+    
+    clear_stat_cache()
     print("[SUCCESS] Reset dell'ambiente completato.")
 
 
-def initialize_logging(config: Dict[str, Any]) -> None:
+def initialize_logging(config: Dict[str, Any], verbose: bool = False) -> None:
     """
     Inizializza il sistema di logging.
+    Con verbose=True (--verbose) il livello è DEBUG qualunque sia log_level.
     """
     try:
-        LoggingSetup.setup_logging(config["log"])
+        level_name = str(config.get("log_level", "INFO")).upper()
+        level = logging.getLevelName(level_name)
+        if not isinstance(level, int):
+            print(f"[WARN] log_level '{level_name}' non valido, uso INFO")
+            level = logging.INFO
+        if verbose:
+            level = logging.DEBUG
+        LoggingSetup.setup_logging(config["log"], level)
         logging.info("Sistema di logging completo inizializzato")
     except Exception as e:
         logging.error(f"Errore durante l'inizializzazione del logging: {e}")
 
 
-def initialize_database(config: Dict[str, Any], dry_run: bool = False) -> Optional[DatabaseManager]:
+def initialize_database(config: Dict[str, Any], dry_run: bool = False) -> Optional["DatabaseManager"]:
     """
     Inizializza il database manager.
     """
     try:
+        from database.database_manager import DatabaseManager
+        
         db_path = ":memory:" if dry_run else config["database"]
         db_manager = DatabaseManager(db_path)
+        
+        db_config = config.get("database_config", {})
+        pragmas = dict(db_config.get("pragmas") or {})
+        if not db_config.get("enable_wal_mode", True):
+            pragmas.setdefault("journal_mode", "DELETE")
+        db_manager.apply_pragmas(pragmas)
+        
+        batch_size = config.get("performance_config", {}).get("batch_size", 500)
+        db_manager.start_writer(batch_size=batch_size)
+        
         logging.info(f"Database manager inizializzato (path: {db_path})")
         return db_manager
     except Exception as e:
@@ -211,17 +500,29 @@ def initialize_database(config: Dict[str, Any], dry_run: bool = False) -> Option
         return None
 
 
-def initialize_file_processor(config: Dict[str, Any], db_manager: DatabaseManager, dry_run: bool = False) -> Optional[FileProcessor]:
+def _same_device(source: Path, destination: Path) -> bool:
+    """True se sorgente e destinazione sono sullo stesso filesystem (abilita reflink/hardlink)."""
+    try:
+        return os.stat(source).st_dev == os.stat(destination).st_dev
+    except OSError:
+        return False
+
+
+def initialize_file_processor(config: Dict[str, Any], db_manager: "DatabaseManager", dry_run: bool = False,
+                              max_workers: Optional[int] = None) -> Optional["FileProcessor"]:
     """
     Inizializza il processore dei file.
     """
     try:
-        max_workers = determine_worker_count(config)
+        from processing.file_processor import FileProcessor
+        
+        if max_workers is None:
+            max_workers = determine_worker_count(config)
         
         file_processor = FileProcessor(
             config=config,
-            source_dir=config["source"],
-            dest_dir=config["destination"],
+            source_dir=config["_resolved_source"],
+            dest_dir=config["_resolved_destination"],
             db_manager=db_manager,
             supported_extensions=config["supported_extensions"],
             image_extensions=config["image_extensions"],
@@ -230,98 +531,182 @@ def initialize_file_processor(config: Dict[str, Any], db_manager: DatabaseManage
             exclude_hidden_dirs=config.get("exclude_hidden_dirs", True),
             exclude_patterns=config.get("exclude_patterns", []),
             max_workers=max_workers,
-            dry_run=dry_run
+            dry_run=dry_run,
+            copy_strategy=config.get("copy_config", {}).get("strategy", "sendfile"),
+            same_device=_same_device(config["_resolved_source"], config["_resolved_destination"]),
+            executor_initializer=db_manager.init_thread_conn,
+            analysis_processes=config.get("parallel_processing", {}).get("analysis_processes") or 0,
+            pin_hash_workers=bool(config.get("parallel_processing", {}).get("pin_hash_workers", False))
         )
         logging.info(f"File processor inizializzato con {max_workers} worker (dry_run={dry_run})")
         return file_processor
-    except Exception:
-        print("\n--- ERRORE DETTAGLIATO DURANTE INIZIALIZZAZIONE FILE PROCESSOR ---")
-        traceback.print_exc()
-        print("-----------------------------------------------------------------\n")
+    except Exception as e:
+        logging.exception("Errore inizializzazione FileProcessor")
+        print(f"[ERROR] Errore durante l'inizializzazione del file processor: {e} (traceback nel file di log)")
         return None
 
 
-def print_system_info(config: Dict[str, Any], worker_count: int, dry_run: bool = False, mode: str = 'fresh'):
+def print_system_info(config: Dict[str, Any], workers: WorkerConfig, dry_run: bool = False, mode: str = 'fresh'):
     """
     Stampa informazioni di sistema e configurazione.
     """
     mode_str = " [MODALITÀ DRY-RUN]" if dry_run else ""
-    print(f"\n[START] Photo and Video Organizer - v1.3.3{mode_str}")
-    print("-" * 60)
-    print(f"[INFO] Modalità di esecuzione: {mode.upper()}")
-    print(f"[SYS] CPU disponibili: {os.cpu_count() or 'N/A'}")
-    print(f"[THREADS] Worker thread: {worker_count}")
-    print(f"[FILES] Directory sorgente: {config['source']}")
-    print(f"[FILES] Directory destinazione: {config['destination']}")
-    print(f"[DB] Database: {':memory:' if dry_run else config['database']}")
-    print("-" * 60)
+    parts = [
+        f"\n[START] Photo and Video Organizer - v1.3.3{mode_str}",
+        "-" * 60,
+        f"[INFO] Modalità di esecuzione: {mode.upper()}",
+        f"[SYS] CPU disponibili: {usable_cpu_count()} (sistema: {os.cpu_count() or 'N/A'})",
+        f"[THREADS] Worker thread: {workers.io_workers} I/O, {workers.cpu_workers} hash/metadati",
+        f"[FILES] Directory sorgente: {config['source']}",
+        f"[FILES] Directory destinazione: {config['destination']}",
+        f"[DB] Database: {':memory:' if dry_run else config['database']}",
+        "-" * 60,
+    ]
+    sys.stdout.write("\n".join(parts) + "\n")
+    sys.stdout.flush()
 
 
-def generate_final_report(db_manager: DatabaseManager, processing_time: float, dry_run: bool = False):
+def generate_final_report(db_manager: "DatabaseManager", processing_time: float, dry_run: bool = False):
     """
     Genera e mostra un report finale delle operazioni.
+    Il report viene composto in memoria e scritto su stdout con una sola write;
+    le righe della query per anno vengono consumate in un solo passaggio.
     """
     try:
-        stats = db_manager.get_statistics()
         mode_str = " (DRY-RUN)" if dry_run else ""
-        print(f"\n[STATS] REPORT FINALE{mode_str} - Processing completato in {processing_time:.2f} secondi")
-        print("=" * 60)
+        parts = [
+            f"\n[STATS] REPORT FINALE{mode_str} - Processing completato in {processing_time:.2f} secondi",
+            "=" * 60,
+        ]
         
-        total = stats['general'].get('total_files', 0)
-        processed = stats['general'].get('processed_files', 0)
-        photos = stats['general'].get('photos', 0)
-        videos = stats['general'].get('videos', 0)
-        duplicates = stats['general'].get('duplicate_files', 0)
-        unsupported = stats['general'].get('unsupported_files', 0)
-        errors = stats['general'].get('error_files', 0)
+        total = processed = photos = videos = duplicates = unsupported = errors = 0
+        year_lines = []
+        for year, y_total, y_processed, y_duplicates, y_errors, y_unsupported, y_photos, y_videos \
+                in db_manager.iter_year_statistics():
+            total += y_total
+            processed += y_processed
+            duplicates += y_duplicates
+            errors += y_errors
+            unsupported += y_unsupported
+            photos += y_photos
+            videos += y_videos
+            if year is not None and year != 'Unknown':
+                year_lines.append(f"   {year}: {y_total} file")
         
         prefix = "SIMULAZIONE" if dry_run else "RISULTATO"
         
-        print(f"[{prefix}] File totali analizzati: {total}")
-        print(f"[{prefix}] File organizzati: {processed} (Foto: {photos}, Video: {videos})")
-        print(f"[{prefix}] Duplicati gestiti: {duplicates}")
-        print(f"[{prefix}] File non supportati: {unsupported}")
+        parts.append(f"[{prefix}] File totali analizzati: {total}")
+        parts.append(f"[{prefix}] File organizzati: {processed} (Foto: {photos}, Video: {videos})")
+        parts.append(f"[{prefix}] Duplicati gestiti: {duplicates}")
+        parts.append(f"[{prefix}] File non supportati: {unsupported}")
         if errors > 0:
-            print(f"[ERROR] Errori riscontrati: {errors}")
+            parts.append(f"[ERROR] Errori riscontrati: {errors}")
 
-        if stats.get('yearly'):
-            print("\n[DATE] Distribuzione per anno:")
-            for year, count in sorted(stats['yearly'].items(), reverse=True):
-                print(f"   {year}: {count} file")
+        if year_lines:
+            parts.append("\n[DATE] Distribuzione per anno:")
+            parts.extend(year_lines)
         
         if total > 0 and processing_time > 0:
             throughput = total / processing_time
-            print(f"\n[PERF] Performance: {throughput:.1f} file/secondo")
+            parts.append(f"\n[PERF] Performance: {throughput:.1f} file/secondo")
         
-        print("=" * 60)
+        parts.append("=" * 60)
         if dry_run:
-            print("[DRY-RUN] Per eseguire realmente le operazioni, lancia il comando senza il flag --dry-run.")
+            parts.append("[DRY-RUN] Per eseguire realmente le operazioni, lancia il comando senza il flag --dry-run.")
+        
+        sys.stdout.write("\n".join(parts) + "\n")
+        sys.stdout.flush()
 
     except Exception as e:
         print(f"[ERROR] Errore nella generazione del report finale: {e}")
 
 
-def parse_arguments():
+HELP_TEXT = """\
+usage: PhotoOrg.py [-h] [--reset] [--reset-parallel] [--yes] [--dry-run] [--save-plan FILE] [--mode {fresh,merge}] [--rebuild-cache] [--compact] [--verbose] [--version]
+
+Photo and Video Organizer v1.3.3
+
+options:
+  -h, --help            Mostra questo messaggio ed esce.
+  --reset               Reset completo dell'ambiente.
+  --reset-parallel      Con --reset, elimina le cartelle con thread paralleli.
+  --yes, -y             Risponde sì a tutte le conferme (uso non interattivo).
+  --dry-run             Simula le operazioni senza modifiche reali.
+  --save-plan FILE      Con --dry-run, salva i record della simulazione in un file database SQLite.
+  --mode {fresh,merge}  Modalità: 'fresh' o 'merge'.
+  --rebuild-cache       In modalità merge, ricalcola l'hash di tutti i file in destinazione ignorando la cache.
+  --compact             A fine esecuzione compatta il database con un VACUUM completo.
+  --verbose             Log dettagliato (DEBUG) per ogni file processato.
+  --version             Mostra la versione ed esce."""
+
+_FLAGS = {
+    "--reset": "reset",
+    "--reset-parallel": "reset_parallel",
+    "--yes": "yes",
+    "-y": "yes",
+    "--dry-run": "dry_run",
+    "--compact": "compact",
+    "--rebuild-cache": "rebuild_cache",
+    "--verbose": "verbose",
+}
+_MODES = ("fresh", "merge")
+
+
+def _argument_error(message: str) -> None:
+    sys.stderr.write(f"{HELP_TEXT.splitlines()[0]}\nPhotoOrg.py: error: {message}\n")
+    sys.exit(2)
+
+
+def _option_value(argv: List[str], i: int, name: str) -> Tuple[str, int]:
+    """Valore di un'opzione nelle forme '--name VALORE' e '--name=VALORE'; ritorna (valore, indice)."""
+    if argv[i] == name:
+        i += 1
+        if i >= len(argv):
+            _argument_error(f"argument {name}: expected one argument")
+        return argv[i], i
+    return argv[i].split("=", 1)[1], i
+
+
+def parse_arguments(argv: Optional[List[str]] = None) -> SimpleNamespace:
     """
     Gestisce il parsing degli argomenti da linea di comando.
+    Scansione diretta di sys.argv: pochi flag non giustificano l'import e la costruzione di argparse.
     """
-    parser = argparse.ArgumentParser(
-        description="Photo and Video Organizer v1.3.3",
-        formatter_class=argparse.RawDescriptionHelpFormatter
-    )
-    parser.add_argument("--reset", action="store_true", help="Reset completo dell'ambiente.")
-    parser.add_argument("--dry-run", action="store_true", help="Simula le operazioni senza modifiche reali.")
-    parser.add_argument("--mode", choices=['fresh', 'merge'], default='fresh', help="Modalità: 'fresh' o 'merge'.")
-    parser.add_argument("--version", action="version", version="PhotoOrg v1.3.3")
-    return parser.parse_args()
+    argv = sys.argv[1:] if argv is None else argv
+    args = SimpleNamespace(mode="fresh", save_plan=None, **{dest: False for dest in _FLAGS.values()})
+    
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg in ("-h", "--help"):
+            print(HELP_TEXT)
+            sys.exit(0)
+        elif arg == "--version":
+            print("PhotoOrg v1.3.3")
+            sys.exit(0)
+        elif arg in _FLAGS:
+            setattr(args, _FLAGS[arg], True)
+        elif arg == "--mode" or arg.startswith("--mode="):
+            value, i = _option_value(argv, i, "--mode")
+            if value not in _MODES:
+                _argument_error(f"argument --mode: invalid choice: '{value}' (choose from 'fresh', 'merge')")
+            args.mode = value
+        elif arg == "--save-plan" or arg.startswith("--save-plan="):
+            args.save_plan, i = _option_value(argv, i, "--save-plan")
+        else:
+            _argument_error(f"unrecognized arguments: {arg}")
+        i += 1
+    if args.save_plan and not args.dry_run:
+        _argument_error("argument --save-plan: requires --dry-run")
+    return args
 
 
 def main():
     """
     Funzione principale con gestione completa degli errori e supporto parallelismo.
     """
-    setup_minimal_logging()
     args = parse_arguments()
+    setup_minimal_logging(args.verbose)
 
     print("[START] Avvio Photo and Video Organizer")
 
@@ -329,20 +714,27 @@ def main():
         config = ConfigLoader.load_config()
         print("[SUCCESS] Configurazione caricata")
         validate_config(config)
+        normalize_extensions(config)
     except Exception as e:
         print(f"[ERROR] Errore di configurazione: {e}")
         return
 
-    initialize_logging(config)
+    initialize_logging(config, args.verbose)
+
+    # I record 'simulated' nel database reale farebbero saltare quei file alla prima esecuzione vera
+    if args.save_plan and Path(args.save_plan).resolve() == Path(config["database"]).resolve():
+        print("[ERROR] --save-plan deve indicare un file diverso dal database della configurazione.")
+        return
 
     if args.reset:
-        reset_environment(config["database"], config["log"], config["destination"])
+        reset_environment(config["database"], config["log"], config["_resolved_destination"], args.reset_parallel, args.yes)
         return
     
-    worker_count = determine_worker_count(config)
-    print_system_info(config, worker_count, args.dry_run, args.mode)
+    workers = determine_worker_config(config)
+    print_system_info(config, workers, args.dry_run, args.mode)
 
-    if not create_destination_directory(Path(config["destination"]), args.dry_run):
+    if not create_destination_directory(config["_resolved_destination"], args.dry_run, args.yes,
+                                        config["_destination_stat"]):
         print("[ERROR] Operazione annullata. Impossibile procedere senza directory di destinazione.")
         return
     
@@ -351,30 +743,62 @@ def main():
         print("[ERROR] Errore critico: impossibile inizializzare il database.")
         return
     
-    file_processor = initialize_file_processor(config, db_manager, args.dry_run)
+    # Prima del processore dei file: il pool di analisi eredita il lock di lettura all'avvio
+    if should_serialize_reads(config):
+        from processing.hash_utils import HashUtils
+        HashUtils.serialize_reads(True)
+        print("[DISK] Sorgente su disco rotativo: letture per l'hash serializzate, calcolo in parallelo")
+        logging.info("Letture per l'hash serializzate (serialize_reads)")
+
+    file_processor = initialize_file_processor(config, db_manager, args.dry_run,
+                                               max_workers=workers.io_workers)
     if file_processor is None:
         print("[ERROR] Errore critico: impossibile inizializzare il processore dei file.")
         return
 
+    if should_preload_metadata(config):
+        preload_metadata(config["_resolved_source"], workers.io_workers)
+
+    from processing.file_pipeline import FilePipeline
+    
     start_time = time.time()
     try:
         if args.mode == 'merge' and not args.dry_run:
-            file_processor.pre_scan_destination()
+            file_processor.pre_scan_destination(rebuild_cache=args.rebuild_cache)
+        if not args.dry_run:
+            file_processor.prime_dest_tree()
         
-        file_processor.scan_directory()
+        pipeline = FilePipeline(
+            file_processor,
+            hash_workers=workers.cpu_workers,
+            write_workers=workers.io_workers,
+            queue_depth=max(workers.io_workers, workers.cpu_workers) * 4,
+            scan_workers=config.get("parallel_processing", {}).get("scan_workers") or 4
+        )
+        pipeline.run()
         
     except KeyboardInterrupt:
         print("\n[WARN] Operazione interrotta dall'utente.")
     except Exception as e:
-        print(f"\n[ERROR] Errore imprevisto durante l'esecuzione: {e}")
-        traceback.print_exc()
+        logging.exception("Errore imprevisto durante l'esecuzione")
+        print(f"\n[ERROR] Errore imprevisto durante l'esecuzione: {e} (traceback nel file di log)")
     finally:
         processing_time = time.time() - start_time
+        db_manager.flush_and_join()
         generate_final_report(db_manager, processing_time, args.dry_run)
-        if not args.dry_run and config.get("database_config", {}).get("vacuum_on_completion", True):
+        if args.save_plan:
+            try:
+                saved = db_manager.persist_to(args.save_plan)
+                print(f"[DRY-RUN] Simulazione salvata in {args.save_plan}: {saved} record")
+            except Exception as e:
+                logging.exception("Errore salvataggio simulazione")
+                print(f"[ERROR] Impossibile salvare la simulazione in {args.save_plan}: {e}")
+        vacuum_mode = config.get("database_config", {}).get("vacuum_on_completion", True)
+        if not args.dry_run and (vacuum_mode or args.compact):
             print("[CLEAN] Ottimizzazione database...")
-            db_manager.cleanup_database()
+            db_manager.cleanup_database(full=args.compact or vacuum_mode == "full")
         print("[END] Esecuzione terminata.")
+        LoggingSetup.stop_logging()
 
 
 if __name__ == "__main__":
@@ -4,18 +4,19 @@ Photo and Video Organizer with Parallel Processing - v1.2.0
 Organizza foto e video con processing parallelo multi-thread
 """
 
-from typing import Dict, Optional, Any
+from typing import TYPE_CHECKING, Dict, Optional, Any
 from config.config_loader import ConfigLoader
-from loggingSetup.logging_setup import LoggingSetup
-from database.database_manager import DatabaseManager
-from processing.file_processor import FileProcessor
 from pathlib import Path
 import sys
 import logging
-import shutil
 import time
 import os
-import argparse
+
+# LoggingSetup, DatabaseManager, FileProcessor, shutil e argparse sono importati nelle
+# funzioni che li usano: --version, --help e gli errori di configurazione non li caricano.
+if TYPE_CHECKING:
+    from database.database_manager import DatabaseManager
+    from processing.file_processor import FileProcessor
 
 
 def setup_minimal_logging():
@@ -67,35 +68,28 @@ def validate_config(config: Dict[str, Any]) -> None:
             f"Questo potrebbe causare perdita di dati. Specificare una destinazione diversa."
         )
     
+    # Contenimento verificato con confronto di prefissi sui path risolti (terminati da os.sep,
+    # così /foto non risulta contenuto in /foto2), senza usare eccezioni come controllo di flusso
+    source_prefix = os.path.join(str(source_path), "")
+    dest_prefix = os.path.join(str(dest_path), "")
+    
     # Controllo che la destinazione non sia una sottodirectory della sorgente
-    try:
-        dest_path.relative_to(source_path)
+    if dest_prefix.startswith(source_prefix):
         raise ValueError(
             f"ERRORE CRITICO: La destinazione è una sottodirectory della sorgente!\n"
             f"Sorgente: {source_path}\n"
             f"Destinazione: {dest_path}\n"
             f"Questo potrebbe causare perdita di dati o loop infiniti."
         )
-    except ValueError as e:
-        # Se relative_to fallisce, è OK (destinazione non è dentro sorgente)
-        if "ERRORE CRITICO" in str(e):
-            raise  # Re-raise se è il nostro errore critico
-        pass  # Altrimenti continua
     
     # Controllo che la sorgente non sia una sottodirectory della destinazione
-    if dest_path.exists():
-        try:
-            source_path.relative_to(dest_path)
-            raise ValueError(
-                f"ERRORE CRITICO: La sorgente è una sottodirectory della destinazione!\n"
-                f"Sorgente: {source_path}\n"
-                f"Destinazione: {dest_path}\n"
-                f"Configurazione non valida."
-            )
-        except ValueError as e:
-            if "ERRORE CRITICO" in str(e):
-                raise
-            pass
+    if source_prefix.startswith(dest_prefix) and dest_path.exists():
+        raise ValueError(
+            f"ERRORE CRITICO: La sorgente è una sottodirectory della destinazione!\n"
+            f"Sorgente: {source_path}\n"
+            f"Destinazione: {dest_path}\n"
+            f"Configurazione non valida."
+        )
     
     # Verifica che la directory sorgente sia accessibile in lettura
     try:
@@ -110,14 +104,19 @@ def validate_config(config: Dict[str, Any]) -> None:
         if not dest_path.is_dir():
             raise ValueError(f"Il percorso di destinazione esiste ma non è una directory: {dest_path}")
         
-        try:
-            test_file = dest_path / ".test_write_permission"
-            test_file.touch()
-            test_file.unlink()
-        except PermissionError:
+        # os.access è un solo controllo sui permessi; su Windows le ACL possono renderlo
+        # inaffidabile, quindi lì resta la prova con file temporaneo
+        if sys.platform == "win32":
+            try:
+                test_file = dest_path / ".test_write_permission"
+                test_file.touch()
+                test_file.unlink()
+            except PermissionError:
+                raise ValueError(f"Permesso negato per scrivere nella directory di destinazione: {dest_path}")
+            except OSError as e:
+                raise ValueError(f"Errore di accesso alla directory di destinazione '{dest_path}': {e}")
+        elif not os.access(dest_path, os.W_OK | os.X_OK):
             raise ValueError(f"Permesso negato per scrivere nella directory di destinazione: {dest_path}")
-        except OSError as e:
-            raise ValueError(f"Errore di accesso alla directory di destinazione '{dest_path}': {e}")
     
     # Verifica che le estensioni siano liste
     for ext_key in ["supported_extensions", "image_extensions", "video_extensions"]:
@@ -261,6 +260,7 @@ def reset_environment(database_path: str, log_path: str, dest_dir: str) -> None:
     
     logging.info("Inizio procedura di reset dell'ambiente")
     print("[RESET] Inizio procedura di reset dell'ambiente")
+    import shutil
     
     reset_success = True
     
@@ -329,6 +329,7 @@ def initialize_logging(config: Dict[str, Any]) -> None:
         config: Dizionario di configurazione
     """
     try:
+        from loggingSetup.logging_setup import LoggingSetup
         LoggingSetup.setup_logging(config["log"])
         logging.info("Sistema di logging completo inizializzato")
     except Exception as e:
@@ -336,7 +337,7 @@ def initialize_logging(config: Dict[str, Any]) -> None:
         logging.info("Continuo con il logging di base")
 
 
-def initialize_database(config: Dict[str, Any], dry_run: bool = False) -> Optional[DatabaseManager]:
+def initialize_database(config: Dict[str, Any], dry_run: bool = False) -> Optional["DatabaseManager"]:
     """
     Inizializza il database manager con gestione errori.
     
@@ -348,6 +349,8 @@ def initialize_database(config: Dict[str, Any], dry_run: bool = False) -> Option
         DatabaseManager istanziato o None in caso di errore
     """
     try:
+        from database.database_manager import DatabaseManager
+        
         if dry_run:
             # In modalità dry-run usa database in memoria
             db_manager = DatabaseManager(":memory:")
@@ -361,7 +364,7 @@ def initialize_database(config: Dict[str, Any], dry_run: bool = False) -> Option
         return None
 
 
-def initialize_file_processor(config: Dict[str, Any], db_manager: DatabaseManager, dry_run: bool = False) -> Optional[FileProcessor]:
+def initialize_file_processor(config: Dict[str, Any], db_manager: "DatabaseManager", dry_run: bool = False) -> Optional["FileProcessor"]:
     """
     Inizializza il processore dei file con gestione errori e supporto parallelo.
     
@@ -374,6 +377,8 @@ def initialize_file_processor(config: Dict[str, Any], db_manager: DatabaseManage
         FileProcessor istanziato o None in caso di errore
     """
     try:
+        from processing.file_processor import FileProcessor
+        
         max_workers = determine_worker_count(config)
         
         file_processor = FileProcessor(
@@ -431,7 +436,7 @@ def print_system_info(config: Dict[str, Any], worker_count: int, dry_run: bool =
     print("-" * 60)
 
 
-def generate_final_report(db_manager: DatabaseManager, processing_time: float, dry_run: bool = False):
+def generate_final_report(db_manager: "DatabaseManager", processing_time: float, dry_run: bool = False):
     """
     Genera e mostra un report finale delle operazioni.
     
@@ -492,6 +497,8 @@ def parse_arguments():
     Returns:
         argparse.Namespace: Argomenti parsati
     """
+    import argparse
+    
     parser = argparse.ArgumentParser(
         description="Photo and Video Organizer con Processing Parallelo v1.2.0",
         formatter_class=argparse.RawDescriptionHelpFormatter,
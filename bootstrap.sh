@@ -8,6 +8,7 @@ sudo apt install -y \
     python3-gi \
     gir1.2-gexiv2-0.10 \
     libgexiv2-dev \
+    libyaml-dev \
     mediainfo \
     python3-dev \
     python3-pip \
@@ -1,11 +1,27 @@
+import copy
+import functools
+import os
+
 import yaml
-from pathlib import Path
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
 
 class ConfigLoader:
     @staticmethod
     def load_config(file_path="config.yaml"):
+        """Carica il config; il parse YAML viene riusato finché mtime e dimensione del file non cambiano."""
+        file_stat = os.stat(file_path)
+        return copy.deepcopy(ConfigLoader._parse_config(os.path.abspath(file_path), file_stat.st_mtime_ns, file_stat.st_size))
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1)
+    def _parse_config(file_path, mtime_ns, size):
         with open(file_path, "r") as f:
-            return yaml.safe_load(f)
+            return yaml.load(f, Loader=SafeLoader)
 
 # Esempio di utilizzo
-# config = ConfigLoader.load_config()
\ No newline at end of file
+# config = ConfigLoader.load_config()
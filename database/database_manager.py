@@ -4,12 +4,16 @@ Thread-Safe DatabaseManager - v1.1.0 con supporto dry-run
 Manager database thread-safe per gestire operazioni SQLite concorrenti
 """
 
-from typing import Dict, List, Optional, Any, Tuple
+from typing import Dict, Iterator, List, Optional, Any, Tuple
+import atexit
 import sqlite3
 import threading
 import logging
+import os
 from pathlib import Path
 
+from database.db_writer import DatabaseWriter
+
 
 class DatabaseManager:
     """
@@ -17,6 +21,116 @@ class DatabaseManager:
     Supporta connessioni multiple e operazioni atomiche, incluso database in memoria per dry-run.
     """
     
+    # PRAGMA applicati a ogni connessione: WAL permette letture concorrenti con un writer,
+    # synchronous=NORMAL riduce gli fsync ai soli checkpoint; journal_size_limit e
+    # wal_autocheckpoint tengono limitata la crescita del file -wal.
+    DEFAULT_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+        "mmap_size": 2147483648,
+        "cache_size": -65536,
+        "busy_timeout": 30000,
+        "journal_size_limit": 67108864,
+        "wal_autocheckpoint": 1000,
+        "foreign_keys": "ON",
+        "trusted_schema": "OFF",
+    }
+    
+    # PRAGMA efficaci solo su file database ancora vuoto: vanno eseguiti prima di
+    # journal_mode=WAL e della creazione delle tabelle. Pagine da 8KB riducono la
+    # profondità del B-tree dell'indice hash.
+    NEW_DB_PRAGMAS = {
+        "page_size": 8192,
+        "auto_vacuum": "INCREMENTAL",
+    }
+    
+    # Schema completo, eseguito con un solo executescript. auto_vacuum è efficace solo su
+    # database nuovo (prima delle tabelle); per i file database lo imposta già NEW_DB_PRAGMAS
+    # prima di journal_mode=WAL, qui serve al database in memoria.
+    _SCHEMA_SQL = """
+        PRAGMA auto_vacuum=INCREMENTAL;
+        
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            original_path TEXT NOT NULL UNIQUE,
+            hash TEXT,
+            year TEXT,
+            month TEXT,
+            media_type TEXT,
+            status TEXT,
+            destination_path TEXT,
+            final_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            file_size INTEGER,
+            processing_thread TEXT,
+            notes TEXT
+        );
+        
+        CREATE INDEX IF NOT EXISTS idx_files_hash ON files(hash);
+        CREATE INDEX IF NOT EXISTS idx_files_media_type_year_month ON files(media_type, year, month);
+        CREATE INDEX IF NOT EXISTS idx_files_status ON files(status);
+        
+        -- Hash dei file già presenti in destinazione, validi finché mtime e dimensione non cambiano:
+        -- la pre-scansione merge non rilegge i file invariati tra un'esecuzione e l'altra
+        CREATE TABLE IF NOT EXISTS hash_cache (
+            path TEXT PRIMARY KEY,
+            mtime_ns INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            hash TEXT NOT NULL
+        ) WITHOUT ROWID;
+        
+        CREATE TABLE IF NOT EXISTS processing_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_start TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            total_files INTEGER DEFAULT 0,
+            processed_files INTEGER DEFAULT 0,
+            duplicate_files INTEGER DEFAULT 0,
+            error_files INTEGER DEFAULT 0,
+            worker_threads INTEGER DEFAULT 1,
+            session_duration REAL,
+            completed_at TIMESTAMP
+        );
+    """
+    
+    # OR IGNORE: original_path è UNIQUE, un file già registrato (ripresa di una sessione)
+    # non produce un secondo record né fa fallire il batch del writer
+    _INSERT_FILE_SQL = """
+        INSERT OR IGNORE INTO files (
+            original_path, hash, year, month, media_type, 
+            status, destination_path, final_name, file_size, processing_thread
+        )
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """
+    
+    # Hash calcolato dopo l'insert (prefiltro per dimensione, vedi FileProcessor)
+    _UPDATE_HASH_SQL = "UPDATE files SET hash = ? WHERE original_path = ?"
+    
+    _UPSERT_HASH_CACHE_SQL = "INSERT OR REPLACE INTO hash_cache (path, mtime_ns, size, hash) VALUES (?, ?, ?, ?)"
+    
+    _INSERT_UNPROCESSED_SQL = """
+        INSERT OR IGNORE INTO files (original_path, status, notes, processing_thread)
+        VALUES (?, ?, ?, ?)
+    """
+    
+    # PRAGMA del bundle senza effetto utile su un database in memoria
+    _MEMORY_DB_SKIPPED_PRAGMAS = frozenset({"journal_mode", "mmap_size", "synchronous", "temp_store", "cache_size"})
+    
+    # Colonne copiate da persist_to: tutte tranne id, riassegnato dal database di destinazione
+    _PERSISTED_COLUMNS = (
+        "original_path", "hash", "year", "month", "media_type", "status",
+        "destination_path", "final_name", "created_at", "file_size", "processing_thread", "notes",
+    )
+    
+    # Colonna di iter_year_statistics incrementata da ciascuno status
+    _STATUS_COLUMNS = {
+        "copied": 2,
+        "simulated": 2,
+        "duplicate": 3,
+        "error": 4,
+        "unsupported": 5,
+    }
+    
     def __init__(self, db_path: str):
         """
         Inizializza il database manager con supporto thread-safe.
@@ -29,10 +143,24 @@ class DatabaseManager:
         self._global_lock = threading.Lock()
         self._initialized = False
         self._memory_db_conn = None
+        # Nome univoco per istanza: due DatabaseManager in memoria non condividono i dati
+        self._memory_uri = f"file:photoorg_{id(self):x}?mode=memory&cache=shared"
+        self._pragmas = dict(self.DEFAULT_PRAGMAS)
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._writer_options = {}
+        self._local = threading.local()
+        self._thread_connections = []
+        self._connections_generation = 0
         
         if not self.is_memory_db:
             db_file = Path(db_path)
             db_file.parent.mkdir(parents=True, exist_ok=True)
+            # Le connessioni per-thread vivono quanto i worker: chiuse comunque all'uscita
+            atexit.register(self.close_thread_connections)
+        # Il writer è un thread daemon: i record ancora in coda vengono scritti comunque
+        # all'uscita (registrato dopo, quindi eseguito prima della chiusura delle connessioni)
+        atexit.register(self.flush_and_join)
         
         if self.is_memory_db:
             with self._global_lock:
@@ -43,120 +171,170 @@ class DatabaseManager:
         logging.info(f"DatabaseManager inizializzato: {db_path}")
 
     def _create_memory_connection(self) -> sqlite3.Connection:
-        """Crea connessione database in memoria."""
+        """
+        Crea connessione database in memoria con URI shared-cache: il database vive finché
+        questa connessione resta aperta, e ogni altra connessione deve usare lo stesso
+        self._memory_uri per vederlo (":memory:" aprirebbe un database privato e vuoto).
+        """
         conn = sqlite3.connect(
-            ":memory:",
+            self._memory_uri,
+            uri=True,
             check_same_thread=False,
             timeout=30.0,
-            isolation_level='DEFERRED'
+            isolation_level='IMMEDIATE'
         )
         
-        conn.execute("PRAGMA synchronous=MEMORY")
-        conn.execute("PRAGMA temp_store=MEMORY")
-        conn.execute("PRAGMA cache_size=10000")
+        # Niente disco: synchronous, temp_store e cache_size non hanno effetto utile
+        # (synchronous=MEMORY non è nemmeno un valore valido). locking_mode=EXCLUSIVE non si
+        # usa: open_read_only apre una seconda connessione sulla stessa URI shared-cache.
+        conn.execute("PRAGMA journal_mode=MEMORY")
         
         return conn
 
-    def create_db(self) -> sqlite3.Connection:
-        """Crea connessione database."""
+    def create_db(self, read_only: bool = False) -> sqlite3.Connection:
+        """
+        Crea connessione database.
+        
+        Args:
+            read_only: connessione di sola lettura in autocommit (PRAGMA query_only):
+                non apre mai transazioni, quindi in WAL non contende il lock col writer
+        """
         if self.is_memory_db:
             return self._memory_db_conn
         
+        # IMMEDIATE: la transazione implicita prende subito il lock di scrittura,
+        # evitando l'escalation (e il deadlock) da lettura a scrittura.
         conn = sqlite3.connect(
             self.db_path,
             check_same_thread=False,
             timeout=30.0,
-            isolation_level='DEFERRED'
+            isolation_level=None if read_only else 'IMMEDIATE'
         )
         
-        conn.execute("PRAGMA journal_mode=WAL")
-        conn.execute("PRAGMA synchronous=NORMAL")
-        conn.execute("PRAGMA temp_store=MEMORY")
-        conn.execute("PRAGMA mmap_size=268435456")
-        conn.execute("PRAGMA cache_size=10000")
+        # Schema già creato: nessun lock, solo i PRAGMA della connessione
+        if self._initialized:
+            self._execute_pragmas(conn)
+        else:
+            with self._global_lock:
+                if not self._initialized and os.path.getsize(self.db_path) == 0:
+                    for key, value in self.NEW_DB_PRAGMAS.items():
+                        conn.execute(f"PRAGMA {key}={value}")
+            
+            self._execute_pragmas(conn)
+            
+            with self._global_lock:
+                if not self._initialized:
+                    self._initialize_schema(conn)
+                    self._initialized = True
         
-        with self._global_lock:
-            if not self._initialized:
-                self._initialize_schema(conn)
-                self._initialized = True
+        if read_only:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def apply_pragmas(self, pragmas: Optional[Dict[str, Any]] = None):
+        """
+        Aggiorna il bundle di PRAGMA usato per ogni nuova connessione.
         
+        Args:
+            pragmas: Override da unire ai DEFAULT_PRAGMAS (es. database_config.pragmas)
+        """
+        self._pragmas.update(pragmas or {})
+        if self.is_memory_db:
+            with self._global_lock:
+                self._execute_pragmas(self._memory_db_conn)
+
+    def _execute_pragmas(self, conn: sqlite3.Connection):
+        """Esegue i PRAGMA configurati su una connessione appena aperta."""
+        for key, value in self._pragmas.items():
+            if self.is_memory_db and key in self._MEMORY_DB_SKIPPED_PRAGMAS:
+                continue
+            conn.execute(f"PRAGMA {key}={value}")
+
+    def open_read_only(self) -> sqlite3.Connection:
+        """
+        Connessione in sola lettura per report e statistiche: URI mode=ro per i file database
+        (non blocca mai il writer), stessa URI shared-cache con query_only per quello in memoria.
+        """
+        if self.is_memory_db:
+            conn = sqlite3.connect(self._memory_uri, uri=True, check_same_thread=False, timeout=30.0)
+            conn.execute("PRAGMA query_only=ON")
+            return conn
+        if not self._initialized:
+            # Lo schema lo crea la prima connessione (di solito quella del writer thread, in
+            # parallelo): una lettura mode=ro non può crearlo e non deve precederlo
+            self.create_db().close()
+        uri = f"{Path(self.db_path).resolve().as_uri()}?mode=ro"
+        return sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=30.0)
+
+    def get_thread_local_connection(self) -> sqlite3.Connection:
+        """
+        Connessione di sola lettura dedicata al thread corrente, aperta alla prima richiesta
+        con i PRAGMA configurati. Le scritture passano dal DatabaseWriter (enqueue_*).
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.generation != self._connections_generation:
+            conn = self.create_db(read_only=True)
+            self._local.conn = conn
+            self._local.generation = self._connections_generation
+            if not self.is_memory_db:
+                with self._global_lock:
+                    self._thread_connections.append(conn)
         return conn
 
+    def init_thread_conn(self):
+        """Initializer per ThreadPoolExecutor: apre subito la connessione del worker."""
+        self.get_thread_local_connection()
+
+    def close_thread_connections(self):
+        """Chiude tutte le connessioni per-thread; i thread che ne richiedono una nuova la riaprono."""
+        with self._global_lock:
+            connections, self._thread_connections = self._thread_connections, []
+            self._connections_generation += 1
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception as e:
+                logging.warning(f"Errore chiusura connessione database: {e}")
+
     def _initialize_schema(self, conn: sqlite3.Connection):
-        """Inizializza schema database."""
-        cursor = conn.cursor()
+        """Inizializza schema database: un solo executescript per tabelle e indici."""
+        conn.executescript(self._SCHEMA_SQL)
         
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS files (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                original_path TEXT NOT NULL,
-                hash TEXT,
-                year TEXT,
-                month TEXT,
-                media_type TEXT,
-                status TEXT,
-                destination_path TEXT,
-                final_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                file_size INTEGER,
-                processing_thread TEXT,
-                notes TEXT
-            )
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_files_hash 
-            ON files(hash)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_files_media_type_year_month 
-            ON files(media_type, year, month)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_files_status 
-            ON files(status)
-        """)
-        
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_files_original_path 
-            ON files(original_path)
-        """)
-        
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS processing_stats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_start TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                total_files INTEGER DEFAULT 0,
-                processed_files INTEGER DEFAULT 0,
-                duplicate_files INTEGER DEFAULT 0,
-                error_files INTEGER DEFAULT 0,
-                worker_threads INTEGER DEFAULT 1,
-                session_duration REAL,
-                completed_at TIMESTAMP
-            )
-        """)
+        # Il vincolo UNIQUE crea già l'indice su original_path; i database creati prima
+        # del vincolo mantengono l'indice semplice (exists resta una lookup indicizzata)
+        if self._has_unique_original_path(conn):
+            conn.execute("DROP INDEX IF EXISTS idx_files_original_path")
+        else:
+            logging.warning("Tabella files senza vincolo UNIQUE su original_path: usare --reset per ricrearla")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_original_path ON files(original_path)")
         
         conn.commit()
         mode_str = " (in memoria)" if self.is_memory_db else ""
         logging.info(f"Schema database inizializzato{mode_str}")
 
+    @staticmethod
+    def _has_unique_original_path(conn: sqlite3.Connection) -> bool:
+        """True se la tabella files ha un indice UNIQUE sulla sola colonna original_path."""
+        for _, name, unique, *_ in conn.execute("PRAGMA index_list(files)").fetchall():
+            if unique and [col[2] for col in conn.execute(f"PRAGMA index_info('{name}')")] == ["original_path"]:
+                return True
+        return False
+
+    def exists(self, original_path: str, conn: Optional[sqlite3.Connection] = None) -> bool:
+        """
+        Verifica con una lookup sull'indice di original_path se il file è già registrato.
+        
+        Args:
+            conn: Connessione da usare; default la connessione di sola lettura del thread
+        """
+        conn = conn or self.get_thread_local_connection()
+        return conn.execute("SELECT 1 FROM files WHERE original_path = ? LIMIT 1",
+                            (original_path,)).fetchone() is not None
+
     def insert_file(self, conn: sqlite3.Connection, record: Tuple[str, ...]):
         """Inserisce record file."""
-        cursor = conn.cursor()
-        
         try:
-            extended_record = record + (threading.get_ident(),)
-            
-            cursor.execute("""
-                INSERT INTO files (
-                    original_path, hash, year, month, media_type, 
-                    status, destination_path, final_name, processing_thread
-                )
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, extended_record)
-            
+            conn.execute(self._INSERT_FILE_SQL, record + (threading.get_ident(),))
             conn.commit()
             
         except Exception as e:
@@ -166,70 +344,220 @@ class DatabaseManager:
 
     def insert_unprocessed_file(self, conn: sqlite3.Connection, original_path: str, status: str, notes: str):
         """Inserisce un record per un file non processato."""
-        cursor = conn.cursor()
         try:
-            cursor.execute("""
-                INSERT INTO files (original_path, status, notes, processing_thread)
-                VALUES (?, ?, ?, ?)
-            """, (original_path, status, notes, threading.get_ident()))
+            conn.execute(self._INSERT_UNPROCESSED_SQL, (original_path, status, notes, threading.get_ident()))
             conn.commit()
         except Exception as e:
             logging.error(f"Errore inserimento file non processato nel database: {e}")
             conn.rollback()
             raise
 
-    def get_statistics(self) -> Dict[str, Any]:
-        """Recupera statistiche database."""
+    def start_writer(self, batch_size: int = 500, flush_interval_s: float = 1.0, queue_size: int = 10000):
+        """
+        Avvia il thread writer unico usato da enqueue_file/enqueue_unprocessed_file.
+        
+        Args:
+            batch_size: Numero di record per transazione
+            flush_interval_s: Attesa massima prima di scrivere un batch incompleto
+            queue_size: Capienza della coda (backpressure sui worker)
+        """
+        with self._writer_lock:
+            self._writer_options = {
+                "batch_size": batch_size,
+                "flush_interval_s": flush_interval_s,
+                "queue_size": queue_size
+            }
+            if self._writer is None:
+                self._writer = DatabaseWriter(self, **self._writer_options)
+                self._writer.start()
+
+    def _get_writer(self) -> DatabaseWriter:
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = DatabaseWriter(self, **self._writer_options)
+                self._writer.start()
+            return self._writer
+
+    def enqueue_file(self, record: Tuple[str, ...]):
+        """Accoda un record file per il writer thread (stesso formato di insert_file)."""
+        self._get_writer().put(self._INSERT_FILE_SQL, record + (threading.get_ident(),))
+
+    def enqueue_hash_update(self, original_path: str, file_hash: str):
+        """Accoda l'aggiornamento dell'hash di un record già accodato o scritto senza hash."""
+        self._get_writer().put(self._UPDATE_HASH_SQL, (file_hash, original_path))
+
+    def enqueue_hash_cache(self, path: str, mtime_ns: int, size: int, file_hash: str):
+        """Accoda l'aggiornamento della cache hash di un file in destinazione."""
+        self._get_writer().put(self._UPSERT_HASH_CACHE_SQL, (path, mtime_ns, size, file_hash))
+
+    def enqueue_unprocessed_file(self, original_path: str, status: str, notes: str):
+        """Accoda un record per un file non processato per il writer thread."""
+        self._get_writer().put(self._INSERT_UNPROCESSED_SQL, (original_path, status, notes, threading.get_ident()))
+
+    def flush(self):
+        """Committa i record già accodati senza fermare il writer (checkpoint tra fasi)."""
+        with self._writer_lock:
+            writer = self._writer
+        if writer is not None:
+            writer.flush()
+
+    def flush_and_join(self):
+        """Scrive tutti i record in coda e ferma il writer thread (riavviato al prossimo enqueue)."""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.stop()
+
+    def persist_to(self, disk_path: str) -> int:
+        """
+        Copia i record del database in memoria (dry-run) in un file database, con un solo
+        INSERT ... SELECT tra database ATTACH-ati: la copia avviene tutta dentro SQLite.
+        Ritorna il numero di record scritti (quelli già presenti per original_path sono ignorati).
+        """
+        if not self.is_memory_db:
+            raise ValueError("persist_to è disponibile solo per il database in memoria")
+        
+        # Il file database riceve schema e PRAGMA come ogni altro database su disco
+        DatabaseManager(disk_path).create_db().close()
+        
+        columns = ", ".join(self._PERSISTED_COLUMNS)
+        with self._global_lock:
+            conn = self._memory_db_conn
+            conn.commit()
+            conn.execute("ATTACH DATABASE ? AS disk", (disk_path,))
+            try:
+                cursor = conn.execute(f"INSERT OR IGNORE INTO disk.files ({columns}) SELECT {columns} FROM main.files")
+                conn.commit()
+                return cursor.rowcount
+            finally:
+                conn.execute("DETACH DATABASE disk")
+
+    def iter_year_statistics(self) -> Iterator[Tuple[Any, ...]]:
+        """
+        Genera una riga per anno, in ordine di anno decrescente:
+        (year, total, processed, duplicates, errors, unsupported, photos, videos).
+        La query raggruppa solo per (year, status, media_type), senza espressioni per riga:
+        i pochi gruppi risultanti vengono ripiegati per anno in Python.
+        """
+        if self.is_memory_db and self._memory_db_conn is None:
+            return
+        conn = self.open_read_only()
+        
         try:
-            if self.is_memory_db:
-                if self._memory_db_conn is None:
-                    return self._empty_stats()
-                conn = self._memory_db_conn
-            else:
-                conn = sqlite3.connect(self.db_path)
-            
-            cursor = conn.cursor()
-            
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as total_files,
-                    COUNT(CASE WHEN status = 'copied' OR status = 'simulated' THEN 1 END) as processed,
-                    COUNT(CASE WHEN status = 'duplicate' THEN 1 END) as duplicates,
-                    COUNT(CASE WHEN status = 'error' THEN 1 END) as errors,
-                    COUNT(CASE WHEN status = 'unsupported' THEN 1 END) as unsupported,
-                    COUNT(CASE WHEN media_type = 'PHOTO' THEN 1 END) as photos,
-                    COUNT(CASE WHEN media_type = 'VIDEO' THEN 1 END) as videos
+            rows = conn.execute("""
+                SELECT year, status, media_type, COUNT(*)
                 FROM files
-            """)
-            
-            general_stats = cursor.fetchone()
-            
-            cursor.execute("""
-                SELECT year, COUNT(*) as count
-                FROM files 
-                WHERE year != 'Unknown' AND year IS NOT NULL
-                GROUP BY year 
+                GROUP BY year, status, media_type
                 ORDER BY year DESC
             """)
-            
-            yearly_stats = cursor.fetchall()
-            
-            if not self.is_memory_db:
-                conn.close()
-            
-            return {
-                'general': {
-                    'total_files': general_stats[0],
-                    'processed_files': general_stats[1],
-                    'duplicate_files': general_stats[2],
-                    'error_files': general_stats[3],
-                    'unsupported_files': general_stats[4],
-                    'photos': general_stats[5],
-                    'videos': general_stats[6]
-                },
-                'yearly': dict(yearly_stats),
-                'last_session': None
-            }
+            current = None
+            for year, status, media_type, count in rows:
+                if current is None or current[0] != year:
+                    if current is not None:
+                        yield tuple(current)
+                    current = [year, 0, 0, 0, 0, 0, 0, 0]
+                current[1] += count
+                column = self._STATUS_COLUMNS.get(status)
+                if column is not None:
+                    current[column] += count
+                if media_type == 'PHOTO':
+                    current[6] += count
+                elif media_type == 'VIDEO':
+                    current[7] += count
+            if current is not None:
+                yield tuple(current)
+        finally:
+            conn.close()
+
+    def load_hashes(self) -> set:
+        """Insieme degli hash già registrati, letto con un'unica scansione dell'indice idx_files_hash."""
+        if self.is_memory_db and self._memory_db_conn is None:
+            return set()
+        conn = self.open_read_only()
+        try:
+            return {file_hash for (file_hash,) in conn.execute("SELECT DISTINCT hash FROM files WHERE hash IS NOT NULL")}
+        finally:
+            conn.close()
+
+    def count_hashes(self) -> int:
+        """Numero di record con hash (dimensiona il filtro di Bloom degli hash)."""
+        if self.is_memory_db and self._memory_db_conn is None:
+            return 0
+        conn = self.open_read_only()
+        try:
+            return conn.execute("SELECT COUNT(hash) FROM files").fetchone()[0]
+        finally:
+            conn.close()
+
+    def iter_hashes(self) -> Iterator[str]:
+        """Hash registrati in streaming, senza materializzarli (ripetuti se più file hanno lo stesso hash)."""
+        if self.is_memory_db and self._memory_db_conn is None:
+            return
+        conn = self.open_read_only()
+        try:
+            for (file_hash,) in conn.execute("SELECT hash FROM files WHERE hash IS NOT NULL"):
+                yield file_hash
+        finally:
+            conn.close()
+
+    def has_hash(self, file_hash: str) -> bool:
+        """Lookup sull'indice idx_files_hash: si ferma alla prima riga trovata."""
+        conn = self.get_thread_local_connection()
+        return conn.execute("SELECT 1 FROM files WHERE hash = ? LIMIT 1", (file_hash,)).fetchone() is not None
+
+    def load_hash_cache(self) -> Dict[str, Tuple[int, int, str]]:
+        """Cache hash della destinazione: path -> (mtime_ns, dimensione, hash), letta in una volta."""
+        if self.is_memory_db and self._memory_db_conn is None:
+            return {}
+        conn = self.open_read_only()
+        try:
+            return {path: (mtime_ns, size, file_hash)
+                    for path, mtime_ns, size, file_hash in conn.execute("SELECT path, mtime_ns, size, hash FROM hash_cache")}
+        finally:
+            conn.close()
+
+    def load_size_index(self) -> Dict[int, Optional[Tuple[str, str]]]:
+        """
+        Dimensioni dei file già registrati: None se i file di quella dimensione hanno un hash,
+        altrimenti (original_path, destination_path) dell'unico file registrato senza hash.
+        """
+        if self.is_memory_db and self._memory_db_conn is None:
+            return {}
+        sizes: Dict[int, Optional[Tuple[str, str]]] = {}
+        conn = self.open_read_only()
+        try:
+            for file_size, file_hash, original_path, destination_path in conn.execute(
+                    "SELECT file_size, hash, original_path, destination_path FROM files WHERE file_size IS NOT NULL"):
+                if file_hash is not None:
+                    sizes[file_size] = None
+                elif file_size not in sizes:
+                    sizes[file_size] = (original_path, destination_path)
+            return sizes
+        finally:
+            conn.close()
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """
+        Recupera statistiche database con una sola query raggruppata (iter_year_statistics).
+        'yearly' è già ordinato per anno decrescente.
+        """
+        # Le statistiche devono includere i record ancora in coda al writer
+        self.flush()
+        try:
+            stats = self._empty_stats()
+            general = stats['general']
+            yearly = stats['yearly']
+            for year, total, processed, duplicates, errors, unsupported, photos, videos in self.iter_year_statistics():
+                general['total_files'] += total
+                general['processed_files'] += processed
+                general['duplicate_files'] += duplicates
+                general['error_files'] += errors
+                general['unsupported_files'] += unsupported
+                general['photos'] += photos
+                general['videos'] += videos
+                if year is not None and year != 'Unknown':
+                    yearly[year] = total
+            return stats
         except Exception as e:
             logging.error(f"Errore recupero statistiche: {e}")
             return self._empty_stats()
@@ -250,15 +578,34 @@ class DatabaseManager:
             'last_session': None
         }
 
-    def cleanup_database(self):
-        """Pulizia database (solo per file)."""
+    def cleanup_database(self, full: bool = False):
+        """
+        Pulizia database (solo per file).
+        
+        Args:
+            full: True = VACUUM completo (riscrive tutto il file, opt-in con --compact),
+                  False = incremental_vacuum + wal_checkpoint(TRUNCATE) + optimize, con costo
+                  proporzionale alle pagine liberate, al WAL e alle statistiche da aggiornare
+        """
         if self.is_memory_db:
             return
-            
+        
+        # Checkpoint e vacuum solo dopo che il writer ha scritto tutto ciò che è in coda
+        self.flush_and_join()
         with self._global_lock:
             conn = sqlite3.connect(self.db_path)
             cursor = conn.cursor()
-            cursor.execute("VACUUM")
-            cursor.execute("ANALYZE")
+            if full:
+                # Converte anche i database creati prima di auto_vacuum=INCREMENTAL
+                cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+                cursor.execute("VACUUM")
+                cursor.execute("ANALYZE")
+            else:
+                if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+                    cursor.execute("PRAGMA incremental_vacuum(4096)")
+                else:
+                    logging.info("Database senza auto_vacuum=INCREMENTAL: pagine libere recuperabili con --compact")
+                cursor.execute("PRAGMA optimize")
+            cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
             conn.close()
-            logging.info("Database ottimizzato")
\ No newline at end of file
+            logging.info(f"Database ottimizzato ({'VACUUM completo' if full else 'incrementale'})")
\ No newline at end of file
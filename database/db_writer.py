@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+DatabaseWriter - thread writer unico per SQLite
+Drena una coda limitata e scrive i record in batch, una transazione per batch
+"""
+
+from itertools import groupby
+from typing import Any, List, Tuple
+import logging
+import queue
+import sqlite3
+import threading
+import time
+
+
+class DatabaseWriter(threading.Thread):
+    """
+    Thread dedicato alle scritture: i worker accodano (sql, parametri) e un solo
+    thread esegue executemany in transazioni BEGIN IMMEDIATE ... COMMIT.
+    La coda limitata applica backpressure alla scansione se il disco non tiene il passo.
+    """
+
+    _STOP = object()
+    _FLUSH = object()
+
+    # Oltre a busy_timeout: se un altro processo tiene il lock più a lungo, il batch
+    # viene ritentato con backoff esponenziale prima di ripiegare sul retry riga per riga
+    _LOCKED_RETRIES = 5
+    _LOCKED_BACKOFF_S = 0.1
+
+    # put/flush non attendono all'infinito: ogni _POLL_S controllano che il thread sia ancora vivo
+    _POLL_S = 0.5
+
+    def __init__(self, db_manager, batch_size: int = 500, flush_interval_s: float = 1.0, queue_size: int = 10000):
+        super().__init__(name="DatabaseWriter", daemon=True)
+        self.db_manager = db_manager
+        self.batch_size = max(1, batch_size)
+        self.flush_interval_s = flush_interval_s
+        self._queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+
+    def put(self, sql: str, params: Tuple[Any, ...]):
+        """Accoda una scrittura; blocca se la coda è piena. Solleva RuntimeError se il writer è terminato."""
+        self._put((sql, params))
+
+    def flush(self):
+        """Scrive subito il batch corrente e attende che sia committato (il thread resta attivo)."""
+        done = threading.Event()
+        self._put((self._FLUSH, done))
+        while not done.wait(self._POLL_S):
+            self._check_alive()
+
+    def stop(self):
+        """Scrive i record rimasti in coda e attende la terminazione del thread."""
+        if self.is_alive():
+            try:
+                self._put(self._STOP)
+            except RuntimeError:
+                pass
+        self.join()
+
+    def _put(self, item):
+        while True:
+            self._check_alive()
+            try:
+                self._queue.put(item, timeout=self._POLL_S)
+                return
+            except queue.Full:
+                continue
+
+    def _check_alive(self):
+        if self.error is not None:
+            raise RuntimeError(f"Writer database terminato: {self.error}") from self.error
+        if not self.is_alive():
+            raise RuntimeError("Writer database terminato")
+
+    def run(self):
+        try:
+            self._run()
+        except Exception as e:
+            # I chiamanti di put/flush ricevono l'errore invece di attendere per sempre
+            self.error = e
+            logging.error(f"Writer database terminato per errore: {e}")
+
+    def _run(self):
+        conn = self.db_manager.create_db()
+        batch: List[Tuple[str, Tuple[Any, ...]]] = []
+        deadline = None
+        try:
+            while True:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    item = None
+
+                if item is self._STOP:
+                    break
+                if item is not None and item[0] is self._FLUSH:
+                    if batch:
+                        self._write_batch(conn, batch)
+                        batch = []
+                        deadline = None
+                    item[1].set()
+                    continue
+                if item is not None:
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval_s
+
+                if len(batch) >= self.batch_size or (batch and time.monotonic() >= deadline):
+                    self._write_batch(conn, batch)
+                    batch = []
+                    deadline = None
+        finally:
+            if batch:
+                self._write_batch(conn, batch)
+            if not self.db_manager.is_memory_db:
+                conn.close()
+
+    def _write_batch(self, conn: sqlite3.Connection, batch: List[Tuple[str, Tuple[Any, ...]]]):
+        """Scrive un batch in una singola transazione; in caso di errore riprova riga per riga."""
+        try:
+            for attempt in range(self._LOCKED_RETRIES + 1):
+                try:
+                    with conn:
+                        for sql, group in groupby(batch, key=lambda item: item[0]):
+                            conn.executemany(sql, [params for _, params in group])
+                    return
+                except sqlite3.OperationalError as e:
+                    if "locked" not in str(e) or attempt == self._LOCKED_RETRIES:
+                        raise
+                    delay = self._LOCKED_BACKOFF_S * (2 ** attempt)
+                    logging.warning(f"Database bloccato, nuovo tentativo tra {delay:.1f}s: {e}")
+                    time.sleep(delay)
+        except Exception as e:
+            logging.error(f"Errore scrittura batch database ({len(batch)} record), retry singolo: {e}")
+            for sql, params in batch:
+                try:
+                    with conn:
+                        conn.execute(sql, params)
+                except Exception as row_error:
+                    logging.error(f"Errore inserimento database per {params[0]}: {row_error}")
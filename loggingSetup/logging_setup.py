@@ -1,25 +1,101 @@
+import atexit
 import logging
+import multiprocessing
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
 
+
+class _BufferedFileHandler(logging.FileHandler):
+    """FileHandler con buffer di scrittura da 64KB: flush immediato solo per WARNING e superiori."""
+
+    def _open(self):
+        return open(self.baseFilename, self.mode, buffering=1 << 16,
+                    encoding=self.encoding, errors=self.errors)
+
+    def emit(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+            if record.levelno >= logging.WARNING:
+                self.stream.flush()
+        except Exception:
+            self.handleError(record)
+
+
 class LoggingSetup:
+    _queue = queue.Queue(-1)
+    _listener = None
+    _process_queue = None
+    _process_listener = None
+
     @staticmethod
-    def setup_logging(log_path):
-        """Setup logging solo su file, rimuovendo eventuali handler console."""
+    def setup_queue_handler(level=logging.INFO):
+        """Installa sul root logger solo un QueueHandler: i thread accodano i record senza fare I/O."""
+        root_logger = logging.getLogger()
+        for handler in root_logger.handlers[:]:
+            root_logger.removeHandler(handler)
+        root_logger.addHandler(QueueHandler(LoggingSetup._queue))
+        root_logger.setLevel(level)
+
+    @staticmethod
+    def setup_logging(log_path, level=logging.INFO):
+        """Setup logging solo su file, scritto in background da un QueueListener."""
         log_file = Path(log_path)
         log_file.parent.mkdir(parents=True, exist_ok=True)
-        
-        # Rimuovi TUTTI gli handler esistenti
+
+        LoggingSetup.stop_logging()
+
         root_logger = logging.getLogger()
-        for handler in root_logger.handlers[:]:  # Copia la lista per evitare modifiche durante iterazione
+        if not any(isinstance(h, QueueHandler) for h in root_logger.handlers):
+            LoggingSetup.setup_queue_handler(level)
+        root_logger.setLevel(level)
+
+        # NESSUN StreamHandler = NESSUN output su console
+        file_handler = _BufferedFileHandler(log_file)
+        file_handler.setFormatter(logging.Formatter("%(asctime)s - %(levelname)s - %(message)s"))
+
+        LoggingSetup._listener = QueueListener(LoggingSetup._queue, file_handler, respect_handler_level=True)
+        LoggingSetup._listener.start()
+
+    @staticmethod
+    def process_log_queue():
+        """
+        Coda multiprocessing per i processi worker: un secondo listener inoltra i loro
+        record alla coda principale, quindi finiscono nello stesso file di log.
+        """
+        if LoggingSetup._process_queue is None:
+            LoggingSetup._process_queue = multiprocessing.get_context("spawn").Queue()
+            LoggingSetup._process_listener = QueueListener(LoggingSetup._process_queue,
+                                                           QueueHandler(LoggingSetup._queue))
+            LoggingSetup._process_listener.start()
+        return LoggingSetup._process_queue
+
+    @staticmethod
+    def setup_worker_logging(log_queue, level):
+        """Initializer dei processi worker: i record tornano al processo principale via log_queue."""
+        root_logger = logging.getLogger()
+        for handler in root_logger.handlers[:]:
             root_logger.removeHandler(handler)
-        
-        # Configura SOLO file logging
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s - %(levelname)s - %(message)s",
-            handlers=[
-                logging.FileHandler(log_file),
-                # NESSUN StreamHandler = NESSUN output su console
-            ],
-            force=True  # Forza la riconfigurazione
-        )
\ No newline at end of file
+        root_logger.addHandler(QueueHandler(log_queue))
+        root_logger.setLevel(level)
+
+    @staticmethod
+    def stop_logging():
+        """Svuota la coda, ferma il listener e chiude gli handler reali."""
+        process_listener, LoggingSetup._process_listener = LoggingSetup._process_listener, None
+        if process_listener is not None:
+            # Prima i record dei processi worker, che vengono inoltrati alla coda principale
+            process_listener.stop()
+            LoggingSetup._process_queue = None
+        listener = LoggingSetup._listener
+        if listener is None:
+            return
+        LoggingSetup._listener = None
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+atexit.register(LoggingSetup.stop_logging)
@@ -2,81 +2,152 @@ import gi
 gi.require_version('GExiv2', '0.10')
 from gi.repository import GExiv2
 from pymediainfo import MediaInfo
+import os
 import re
 import logging
+import threading
 
-class DateExtractor:
-    @staticmethod
-    def extract_date(file_path, image_exts=None, video_exts=None):
-        """
-        Estrae la data da un file con gestione robusta e metodi non deprecati.
-        """
-        if file_path is None:
-            logging.warning("extract_date chiamato con file_path None")
-            return None
-        
-        image_exts = image_exts or []
-        video_exts = video_exts or []
-        suffix = file_path.suffix.lower()
+# Warning di exiv2 silenziati alla sorgente, una volta sola, invece di redirigere stderr a ogni file
+GExiv2.log_set_level(GExiv2.LogLevel.MUTE)
 
-        try:
-            logging.debug(f"🔍 Extracting date from: {file_path} (suffix: {suffix})")
+# Un oggetto GExiv2.Metadata per thread, riusato: open_path sostituisce l'immagine caricata
+_tls = threading.local()
 
-            if suffix in image_exts:
-                # PRIORITÀ 1: Estrazione da EXIF per immagini
-                date_result = DateExtractor._extract_from_image_metadata(file_path)
-                if date_result:
-                    logging.info(f"✅ Data estratta da EXIF per {file_path.name}: {date_result}")
-                    return date_result
-                else:
-                    logging.warning(f"⚠️ Estrazione EXIF fallita per {file_path.name}")
+# Date nel nome file, nell'ordine originale: prima YYYY-MM-DD/YYYY_MM_DD, poi YYYYMMDD (copre
+# anche IMG_/MVI_/DSC_YYYYMMDD). In lookahead ogni posizione è un candidato, anche dentro cifre
+# già scartate (IMG_1234_20200115): finditer non le salta.
+_FILENAME_DATE_RES = (
+    re.compile(r"(?=(\d{4})[-_](\d{2})[-_](\d{2}))"),
+    re.compile(r"(?=(\d{4})(\d{2})(\d{2}))"),
+)
+
+# Solo i campi data della traccia General, in ordine di priorità: MediaInfo restituisce
+# una stringa invece di XML da trasformare in oggetti Track
+_VIDEO_DATE_TEMPLATE = "General;%Encoded_Date%|%Tagged_Date%|%File_Modified_Date%"
+_VIDEO_DATE_RE = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+
+_NO_EXTENSIONS = frozenset()
 
-            elif suffix in video_exts:
-                # PRIORITÀ 1: Estrazione da metadata video
-                date_result = DateExtractor._extract_from_video_metadata(file_path)
+# JPEG: EXIF sta in APP1 all'inizio del file, entro i primi KB. Per questi formati chi ha
+# già letto l'inizio del file (per l'hash) può passarlo a extract_date come header, e
+# GExiv2 lo analizza dalla memoria invece di riaprire il file.
+EXIF_HEADER_SUFFIXES = frozenset({".jpg", ".jpeg"})
+EXIF_HEADER_BYTES = 1 << 17
+
+# RAW e HEIC: GExiv2 legge megabyte di header, un sidecar XMP costa pochi KB.
+# Solo per questi formati si cerca il sidecar (foto.xmp o foto.cr2.xmp): per i JPEG
+# sarebbero due open fallite in più per file.
+_SIDECAR_SUFFIXES = frozenset({
+    ".cr2", ".cr3", ".nef", ".arw", ".dng", ".orf", ".rw2", ".raf", ".pef", ".srw", ".heic", ".heif",
+})
+_SIDECAR_READ_BYTES = 1 << 16
+_XMP_DATE_RE = re.compile(rb'(?:exif|photoshop|xmp):(?:DateTimeOriginal|DateCreated)(?:="|>)(\d{4})-(\d{2})-(\d{2})')
+
+
+def extract_date(file_path, image_exts=None, video_exts=None, suffix=None, header=None):
+    """
+    Estrae la data da un file con gestione robusta e metodi non deprecati.
+    image_exts/video_exts: insiemi (frozenset) di estensioni minuscole, test di appartenenza O(1).
+    suffix: estensione già minuscola, se il chiamante l'ha già calcolata.
+    header: primi EXIF_HEADER_BYTES del file già letti (solo EXIF_HEADER_SUFFIXES), opzionale.
+    Funzione di modulo: può essere inviata a un ProcessPoolExecutor per riferimento.
+    """
+    if file_path is None:
+        logging.warning("extract_date chiamato con file_path None")
+        return None
+    
+    image_exts = image_exts or _NO_EXTENSIONS
+    video_exts = video_exts or _NO_EXTENSIONS
+    if suffix is None:
+        suffix = os.path.splitext(file_path.name)[1].lower()
+
+    try:
+        logging.debug("🔍 Extracting date from: %s (suffix: %s)", file_path, suffix)
+
+        if suffix in image_exts:
+            # PRIORITÀ 0: sidecar XMP per RAW/HEIC, senza aprire il file con GExiv2
+            if suffix in _SIDECAR_SUFFIXES:
+                date_result = DateExtractor._extract_from_xmp_sidecar(file_path)
                 if date_result:
-                    logging.info(f"✅ Data estratta da metadata video per {file_path.name}: {date_result}")
+                    logging.debug("✅ Data estratta da sidecar XMP per %s: %s", file_path.name, date_result)
                     return date_result
-                else:
-                    logging.warning(f"⚠️ Estrazione metadata video fallita per {file_path.name}")
 
-            # PRIORITÀ 2: Fallback a filename parsing
-            date_result = DateExtractor._extract_from_filename(file_path)
+            # PRIORITÀ 1: Estrazione da EXIF per immagini
+            date_result = DateExtractor._extract_from_image_metadata(
+                file_path, header if suffix in EXIF_HEADER_SUFFIXES else None)
             if date_result:
-                logging.info(f"✅ Data estratta da filename per {file_path.name}: {date_result}")
+                logging.debug("✅ Data estratta da EXIF per %s: %s", file_path.name, date_result)
                 return date_result
             else:
-                logging.warning(f"⚠️ Estrazione filename fallita per {file_path.name}")
+                logging.debug("⚠️ Estrazione EXIF fallita per %s", file_path.name)
 
-            # PRIORITÀ 3: Nessuna data trovata
-            logging.error(f"❌ IMPOSSIBILE estrarre data per {file_path}")
-            return None
+        elif suffix in video_exts:
+            # PRIORITÀ 1: Estrazione da metadata video
+            date_result = DateExtractor._extract_from_video_metadata(file_path)
+            if date_result:
+                logging.debug("✅ Data estratta da metadata video per %s: %s", file_path.name, date_result)
+                return date_result
+            else:
+                logging.debug("⚠️ Estrazione metadata video fallita per %s", file_path.name)
 
-        except Exception as e:
-            logging.error(f"❌ Errore generale nell'estrazione data per {file_path}: {e}")
-            return None
+        # PRIORITÀ 2: Fallback a filename parsing
+        date_result = DateExtractor._extract_from_filename(file_path)
+        if date_result:
+            logging.debug("✅ Data estratta da filename per %s: %s", file_path.name, date_result)
+            return date_result
+        else:
+            logging.debug("⚠️ Estrazione filename fallita per %s", file_path.name)
+
+        # PRIORITÀ 3: Nessuna data trovata
+        logging.error("❌ IMPOSSIBILE estrarre data per %s", file_path)
+        return None
+
+    except Exception as e:
+        logging.error("❌ Errore generale nell'estrazione data per %s: %s", file_path, e)
+        return None
+
+
+class DateExtractor:
+    @staticmethod
+    def extract_date(file_path, image_exts=None, video_exts=None, suffix=None):
+        """Vedi extract_date di modulo."""
+        return extract_date(file_path, image_exts, video_exts, suffix)
+
+    @staticmethod
+    def _extract_from_xmp_sidecar(file_path):
+        """Estrae la data dal sidecar XMP (foto.xmp o foto.ext.xmp), se esiste."""
+        for sidecar in (file_path.with_suffix(".xmp"), file_path.with_name(file_path.name + ".xmp")):
+            try:
+                with open(sidecar, "rb") as f:
+                    head = f.read(_SIDECAR_READ_BYTES)
+            except OSError:
+                continue
+            match = _XMP_DATE_RE.search(head)
+            if match:
+                y, m, d = (group.decode("ascii") for group in match.groups())
+                if DateExtractor._validate_date(y, m, d):
+                    return (y, m, f"{y}{m}{d}")
+        return None
 
     @staticmethod
-    def _extract_from_image_metadata(file_path):
+    def _extract_from_image_metadata(file_path, header=None):
         """
         Estrae data da metadata immagine usando metodi NON deprecati.
+        Con header (inizio del file già letto) GExiv2 analizza la memoria; se l'header
+        non basta (segmenti APP più grandi) si ripiega sul file.
         """
         try:
-            meta = GExiv2.Metadata()
-            
-            # Soppressione stderr per evitare warning GExiv2 inutili
-            import os, sys
-            stderr_fd = sys.stderr.fileno()
-            devnull = os.open(os.devnull, os.O_WRONLY)
-            old_stderr = os.dup(stderr_fd)
-            os.dup2(devnull, stderr_fd)
-            
-            try:
+            meta = getattr(_tls, "meta", None)
+            if meta is None:
+                meta = _tls.meta = GExiv2.Metadata()
+            if header is not None:
+                try:
+                    meta.open_buf(header)
+                except Exception as e:
+                    logging.debug("Header insufficiente per %s, lettura dal file: %s", file_path, e)
+                    header = None
+            if header is None:
                 meta.open_path(str(file_path))
-            finally:
-                os.dup2(old_stderr, stderr_fd)
-                os.close(old_stderr)
-                os.close(devnull)
 
             # FIX: Usa metodi NON deprecati
             # Invece di has_tag() e get_tag_string(), usa try/except diretto
@@ -93,7 +164,7 @@ class DateExtractor:
                     # FIX: Accesso diretto invece di metodi deprecati
                     date_str = meta[tag]
                     if date_str:
-                        logging.debug(f"🏷️ Tag {tag} trovato: '{date_str}'")
+                        logging.debug("🏷️ Tag %s trovato: '%s'", tag, date_str)
                         
                         # Parse formato: "YYYY:MM:DD HH:MM:SS"
                         date_part = date_str.split(" ")[0]
@@ -102,57 +173,46 @@ class DateExtractor:
                         # Validazione
                         if DateExtractor._validate_date(y, m, d):
                             result = (y, m, f"{y}{m}{d}")
-                            logging.debug(f"✅ Data EXIF validata: {result}")
+                            logging.debug("✅ Data EXIF validata: %s", result)
                             return result
                         else:
-                            logging.warning(f"⚠️ Data EXIF non valida: {y}-{m}-{d}")
+                            logging.warning("⚠️ Data EXIF non valida: %s-%s-%s", y, m, d)
                             
                 except (KeyError, ValueError, IndexError) as e:
                     # Tag non presente o formato errato
-                    logging.debug(f"🏷️ Tag {tag} non utilizzabile: {e}")
+                    logging.debug("🏷️ Tag %s non utilizzabile: %s", tag, e)
                     continue
                 except Exception as e:
-                    logging.warning(f"⚠️ Errore leggendo tag {tag}: {e}")
+                    logging.warning("⚠️ Errore leggendo tag %s: %s", tag, e)
                     continue
             
-            logging.debug(f"⚠️ Nessun tag EXIF utilizzabile per {file_path}")
+            logging.debug("⚠️ Nessun tag EXIF utilizzabile per %s", file_path)
             return None
             
         except Exception as e:
-            logging.error(f"❌ Errore lettura metadata immagine per {file_path}: {e}")
+            logging.error("❌ Errore lettura metadata immagine per %s: %s", file_path, e)
             return None
 
     @staticmethod  
     def _extract_from_video_metadata(file_path):
         """Estrae data da metadata video con gestione robusta."""
         try:
-            media_info = MediaInfo.parse(file_path)
-            
-            for track in media_info.tracks:
-                if track.track_type == "General":
-                    # Prova diversi campi data in ordine di priorità
-                    date_fields = [
-                        track.encoded_date,
-                        track.tagged_date,
-                        track.file_last_modification_date
-                    ]
-                    
-                    for date_str in date_fields:
-                        if date_str:
-                            logging.debug(f"🎬 Video date field: '{date_str}'")
-                            match = re.search(r"(\d{4})-(\d{2})-(\d{2})", str(date_str))
-                            if match:
-                                y, m, d = match.groups()
-                                if DateExtractor._validate_date(y, m, d):
-                                    result = (y, m, f"{y}{m}{d}")
-                                    logging.debug(f"✅ Data video validata: {result}")
-                                    return result
+            date_fields = MediaInfo.parse(str(file_path), parse_speed=0.0, full=False,
+                                          output=_VIDEO_DATE_TEMPLATE)
+            logging.debug("🎬 Video date fields: '%s'", date_fields)
+
+            for match in _VIDEO_DATE_RE.finditer(date_fields):
+                y, m, d = match.groups()
+                if DateExtractor._validate_date(y, m, d):
+                    result = (y, m, f"{y}{m}{d}")
+                    logging.debug("✅ Data video validata: %s", result)
+                    return result
             
-            logging.debug(f"⚠️ Nessuna data video trovata per {file_path}")
+            logging.debug("⚠️ Nessuna data video trovata per %s", file_path)
             return None
             
         except Exception as e:
-            logging.error(f"❌ Errore lettura metadata video per {file_path}: {e}")
+            logging.error("❌ Errore lettura metadata video per %s: %s", file_path, e)
             return None
 
     @staticmethod
@@ -160,36 +220,27 @@ class DateExtractor:
         """Estrae data dal filename con pattern multipli."""
         try:
             name = file_path.name
-            logging.debug(f"📄 Parsing filename: '{name}'")
-            
-            # Pattern multipli per diversi formati filename
-            patterns = [
-                r"(\d{4})[-_](\d{2})[-_](\d{2})",  # YYYY-MM-DD, YYYY_MM_DD
-                r"(\d{4})(\d{2})(\d{2})",          # YYYYMMDD
-                r"IMG_(\d{4})(\d{2})(\d{2})",      # IMG_YYYYMMDD
-                r"MVI_(\d{4})(\d{2})(\d{2})",      # MVI_YYYYMMDD
-                r"DSC_(\d{4})(\d{2})(\d{2})",      # DSC_YYYYMMDD
-            ]
+            logging.debug("📄 Parsing filename: '%s'", name)
             
-            for pattern in patterns:
-                match = re.search(pattern, name)
-                if match:
+            # Regex precompilate, in ordine: si prende il primo candidato con data valida
+            for pattern in _FILENAME_DATE_RES:
+                for match in pattern.finditer(name):
                     y, m, d = match.groups()
-                    logging.debug(f"🎯 Pattern match: {y}-{m}-{d}")
+                    logging.debug("🎯 Pattern match: %s-%s-%s", y, m, d)
                     
                     # Validazione data
                     if DateExtractor._validate_date(y, m, d):
                         result = (y, m, f"{y}{m}{d}")
-                        logging.debug(f"✅ Data filename validata: {result}")
+                        logging.debug("✅ Data filename validata: %s", result)
                         return result
-                    else:
-                        logging.warning(f"⚠️ Data filename non valida: {y}-{m}-{d}")
+                    # Candidato scartato: con la scansione sovrapposta è normale, niente warning
+                    logging.debug("⚠️ Data filename non valida: %s-%s-%s", y, m, d)
             
-            logging.debug(f"⚠️ Nessun pattern filename riconosciuto per '{name}'")
+            logging.debug("⚠️ Nessun pattern filename riconosciuto per '%s'", name)
             return None
             
         except Exception as e:
-            logging.error(f"❌ Errore parsing filename per {file_path}: {e}")
+            logging.error("❌ Errore parsing filename per %s: %s", file_path, e)
             return None
 
     @staticmethod
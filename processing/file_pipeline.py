@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+FilePipeline - elaborazione a 3 stadi con code limitate
+Enumerazione -> hash/metadati -> copia + database, con pool dimensionati separatamente
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait
+import logging
+import queue
+import threading
+from tqdm import tqdm
+
+
+_DONE = object()
+
+# La barra di avanzamento viene aggiornata ogni _PROGRESS_BATCH file invece che a ogni file
+_PROGRESS_BATCH = 32
+
+
+class FilePipeline:
+    """
+    Pipeline producer-consumer sopra un FileProcessor.
+    Stadio 1: scan_workers thread visitano la sorgente e accodano i path.
+    Stadio 2: hash_workers calcolano hash, data e tipo.
+    Stadio 3: write_workers copiano i file e accodano i record al writer del database.
+    Le code hanno capienza queue_depth, quindi lo stadio più veloce si ferma
+    ad aspettare il più lento invece di accumulare path in memoria.
+    """
+
+    def __init__(self, file_processor, hash_workers: int = 4, write_workers: int = 4, queue_depth: int = 16,
+                 scan_workers: int = 1):
+        self.file_processor = file_processor
+        self.scan_workers = max(1, scan_workers)
+        self.hash_workers = max(1, hash_workers)
+        self.write_workers = max(1, write_workers)
+        self.queue_depth = max(1, queue_depth)
+        self._stop = threading.Event()
+        self._count_lock = threading.Lock()
+        self._count = 0
+        self._pending_progress = 0
+
+    def run(self):
+        fp = self.file_processor
+        mode_str = " (modalità DRY-RUN)" if fp.dry_run else ""
+        logging.info(f"Inizio pipeline{mode_str}: {fp.source_dir} "
+                     f"(scan={self.scan_workers}, hash={self.hash_workers}, write={self.write_workers}, "
+                     f"coda={self.queue_depth})")
+        print(f"[{'DRY-RUN' if fp.dry_run else 'START'}] Pipeline: {self.scan_workers} scanner, {self.hash_workers} worker hash, "
+              f"{self.write_workers} worker copia (coda {self.queue_depth})")
+
+        path_queue = queue.Queue(maxsize=self.queue_depth)
+        work_queue = queue.Queue(maxsize=self.queue_depth)
+        pbar = tqdm(desc="Simulazione" if fp.dry_run else "Elaborazione", unit="file")
+
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="enum") as enum_pool, \
+                ThreadPoolExecutor(max_workers=self.hash_workers, thread_name_prefix="hash",
+                                   initializer=fp.hash_worker_initializer) as hash_pool, \
+                ThreadPoolExecutor(max_workers=self.write_workers, thread_name_prefix="write") as write_pool:
+            enum_future = enum_pool.submit(self._enumerate_stage, path_queue)
+            hash_futures = [hash_pool.submit(self._hash_stage, path_queue, work_queue, pbar)
+                            for _ in range(self.hash_workers)]
+            write_futures = [write_pool.submit(self._write_stage, work_queue, pbar)
+                             for _ in range(self.write_workers)]
+            try:
+                enum_future.result()
+            except BaseException:
+                self._stop.set()
+                raise
+            finally:
+                wait([enum_future])
+                for _ in range(self.hash_workers):
+                    path_queue.put(_DONE)
+                wait(hash_futures)
+                for _ in range(self.write_workers):
+                    work_queue.put(_DONE)
+                wait(write_futures)
+                pbar.update(self._pending_progress)
+                pbar.close()
+
+        total = self._count
+        fp.stats['total_files'] = total
+        if total == 0:
+            logging.warning("Nessun file trovato da processare")
+            print("[WARN] Nessun file nuovo trovato nella directory sorgente.")
+        else:
+            logging.info(f"Processati {total} file{mode_str}")
+            print(f"\n[{'DRY-RUN' if fp.dry_run else 'SUCCESS'}] Processing completato.")
+        fp.finish_scan()
+
+    def _enumerate_stage(self, path_queue: queue.Queue):
+        if self.scan_workers > 1:
+            self._parallel_enumerate(path_queue)
+            return
+        for file_path in self.file_processor.iter_source_files():
+            if self._stop.is_set():
+                break
+            path_queue.put(file_path)
+
+    def _parallel_enumerate(self, path_queue: queue.Queue):
+        """
+        Visita con scan_workers thread: ogni thread legge una cartella, rimette in coda le
+        sottocartelle e accoda subito i file, così l'hash parte dalla prima cartella letta.
+        La visita finisce quando non restano cartelle né in coda né in lettura.
+        """
+        fp = self.file_processor
+        dir_queue = queue.Queue()
+        dir_queue.put(str(fp.source_dir))
+        outstanding = [1]
+        outstanding_lock = threading.Lock()
+
+        def walker():
+            while True:
+                current = dir_queue.get()
+                if current is _DONE:
+                    return
+                try:
+                    if not self._stop.is_set():
+                        subdirs, files = fp.scan_dir(current)
+                        with outstanding_lock:
+                            outstanding[0] += len(subdirs)
+                        for subdir in subdirs:
+                            dir_queue.put(subdir)
+                        for entry in files:
+                            file_path = fp.accept_source_entry(entry)
+                            if file_path is not None:
+                                path_queue.put(file_path)
+                finally:
+                    with outstanding_lock:
+                        outstanding[0] -= 1
+                        finished = outstanding[0] == 0
+                    if finished:
+                        for _ in range(self.scan_workers):
+                            dir_queue.put(_DONE)
+
+        with ThreadPoolExecutor(max_workers=self.scan_workers, thread_name_prefix="scan") as scan_pool:
+            walkers = [scan_pool.submit(walker) for _ in range(self.scan_workers)]
+        for future in walkers:
+            future.result()
+
+    def _hash_stage(self, path_queue: queue.Queue, work_queue: queue.Queue, pbar):
+        fp = self.file_processor
+        while True:
+            file_path = path_queue.get()
+            if file_path is _DONE:
+                return
+            if self._stop.is_set():
+                continue
+            try:
+                if fp.is_recorded(file_path):
+                    fp.record_result('skipped')
+                    self._advance(pbar)
+                    continue
+                work_queue.put((file_path,) + fp.analyze_file(file_path))
+            except Exception as e:
+                logging.error(f"Errore processing file {file_path}: {e}")
+                fp.db_manager.enqueue_unprocessed_file(str(file_path), "error", str(e))
+                fp.record_result('error')
+                self._advance(pbar)
+
+    def _write_stage(self, work_queue: queue.Queue, pbar):
+        fp = self.file_processor
+        while True:
+            item = work_queue.get()
+            if item is _DONE:
+                return
+            if self._stop.is_set():
+                continue
+            file_path, media_type, year, month, file_hash, file_size = item
+            try:
+                status = fp.organize_analyzed_file(file_path, media_type, year, month, file_hash, file_size)
+            except Exception as e:
+                logging.error(f"Errore processing {file_path}: {e}")
+                status = 'error'
+            fp.record_result(status, media_type)
+            self._advance(pbar)
+
+    def _advance(self, pbar):
+        with self._count_lock:
+            self._count += 1
+            self._pending_progress += 1
+            if self._pending_progress >= _PROGRESS_BATCH:
+                pbar.update(self._pending_progress)
+                self._pending_progress = 0
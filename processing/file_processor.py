@@ -4,19 +4,60 @@ FileProcessor with Parallel Processing Support and Dry-Run Mode - v1.3.3 (Corret
 Processore di file con supporto per elaborazione parallela multi-thread e modalità simulazione
 """
 
-from typing import List, Tuple, Optional, Dict, Any
+from collections import Counter
+from typing import FrozenSet, Iterable, List, Tuple, Optional, Dict, Any
 import os
+import re
 import sys
 import logging
+import multiprocessing
+import queue
+import tempfile
 import threading
 from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import wait
 import time
 from tqdm import tqdm
 
-from processing.date_extractor import DateExtractor
+from loggingSetup.logging_setup import LoggingSetup
+from processing.date_extractor import EXIF_HEADER_BYTES, EXIF_HEADER_SUFFIXES, extract_date
+from processing.hash_index import BloomHashSet
 from processing.hash_utils import HashUtils
-from processing.file_utils import FileUtils
+from processing.file_pipeline import _PROGRESS_BATCH, FilePipeline
+from processing.file_utils import FileUtils, get_executor, get_process_executor, pin_current_thread, usable_cpu_count
+
+# Esito -> contatore di sessione (copied/simulated sono gestiti a parte in record_result)
+_STATUS_STATS = {'duplicate': 'duplicate_files', 'error': 'error_files', 'skipped': 'skipped_files'}
+
+# Stati del prefiltro per dimensione (vedi FileProcessor._claim)
+_NEW = object()
+_SAMPLED = object()
+
+
+def init_analysis_worker(log_queue, level: int, hash_algorithm: str, read_lock=None):
+    """
+    Initializer dei processi di analisi: logging verso il processo principale, stesso algoritmo
+    hash e, su disco rotativo, lo stesso lock di lettura del processo principale.
+    """
+    LoggingSetup.setup_worker_logging(log_queue, level)
+    HashUtils.set_algorithm(hash_algorithm)
+    if read_lock is not None:
+        HashUtils.serialize_reads(True, read_lock)
+
+
+def analyze_in_worker(file_path: Path, image_extensions: FrozenSet[str],
+                      video_extensions: FrozenSet[str], suffix: str,
+                      need_hash: bool = True) -> Tuple[Optional[str], Optional[Tuple[str, str, str]]]:
+    """
+    Hash e data di un file in un solo task: funzione di modulo, eseguibile in un processo worker.
+    Per i JPEG l'inizio del file letto per l'hash serve anche all'EXIF: una sola apertura.
+    """
+    header = None
+    if suffix in EXIF_HEADER_SUFFIXES and suffix in image_extensions:
+        file_hash, header = HashUtils.compute_hash_and_header(file_path, EXIF_HEADER_BYTES, need_hash)
+    else:
+        file_hash = HashUtils.compute_hash(file_path)[1] if need_hash else None
+    return file_hash, extract_date(file_path, image_extensions, video_extensions, suffix, header)
 
 
 class FileProcessor:
@@ -31,34 +72,111 @@ class FileProcessor:
         source_dir: str,
         dest_dir: str,
         db_manager,
-        supported_extensions: List[str],
-        image_extensions: List[str],
-        video_extensions: List[str],
+        supported_extensions: FrozenSet[str],
+        image_extensions: FrozenSet[str],
+        video_extensions: FrozenSet[str],
         photographic_prefixes: List[str] = None,
         exclude_hidden_dirs: bool = True,
         exclude_patterns: List[str] = None,
         max_workers: Optional[int] = None,
-        dry_run: bool = False
+        dry_run: bool = False,
+        copy_strategy: str = "sendfile",
+        same_device: bool = False,
+        executor_initializer=None,
+        analysis_processes: int = 0,
+        pin_hash_workers: bool = False
     ):
         self.config = config
         self.source_dir = Path(source_dir)
         self.dest_dir = Path(dest_dir)
         self.db_manager = db_manager
-        self.supported_extensions = [ext.lower() for ext in supported_extensions]
-        self.image_extensions = [ext.lower() for ext in image_extensions]
-        self.video_extensions = [ext.lower() for ext in video_extensions]
-        self.photographic_prefixes = photographic_prefixes or []
+        self.supported_extensions = FileProcessor._as_extension_set(supported_extensions)
+        self.image_extensions = FileProcessor._as_extension_set(image_extensions)
+        self.video_extensions = FileProcessor._as_extension_set(video_extensions)
+        # Estensione -> tipo media con una sola lookup; le estensioni supportate ma non
+        # elencate tra immagini e video restano "VIDEO" come prima (media_type_for)
+        self._ext_to_media = {ext: "VIDEO" for ext in self.video_extensions}
+        self._ext_to_media.update({ext: "PHOTO" for ext in self.image_extensions})
+        # Tupla: name.startswith(prefissi) confronta tutti i prefissi in una sola chiamata C
+        self.photographic_prefixes = tuple(photographic_prefixes or ())
         self.exclude_hidden_dirs = exclude_hidden_dirs
         self.exclude_patterns = exclude_patterns or []
+        # Un'unica regex in alternanza al posto di un test di sottostringa per pattern
+        self._exclude_re = re.compile("|".join(map(re.escape, self.exclude_patterns))) if self.exclude_patterns else None
         self.dry_run = dry_run
+        self.copy_strategy = copy_strategy
+        self.same_device = same_device
+        self.executor_initializer = executor_initializer
+        self.pin_hash_workers = pin_hash_workers
+        # dry_run è fisso per tutta la sessione: il ramo viene scelto una volta qui
+        self._organize_file = self._organize_file_dry if dry_run else self._organize_file_real
+        
+        # analysis_processes > 0: hash ed estrazione date (GExiv2/MediaInfo + regex) girano
+        # in un pool di processi, un task per file; i thread hash attendono il risultato fuori
+        # dal GIL.
+        self._analysis_pool = None
+        self.hash_algorithm = HashUtils.set_algorithm(config.get("performance_config", {}).get("hash_algorithm"))
+        if analysis_processes > 0:
+            # Letture serializzate: il lock per-processo non basta, serve un lock condiviso
+            # tra principale e processi di analisi (passato nell'initializer)
+            read_lock = None
+            if HashUtils.reads_serialized():
+                read_lock = multiprocessing.get_context("spawn").Lock()
+                HashUtils.serialize_reads(True, read_lock)
+            self._analysis_pool = get_process_executor(
+                analysis_processes,
+                initializer=init_analysis_worker,
+                initargs=(LoggingSetup.process_log_queue(), logging.getLogger().level, self.hash_algorithm,
+                          read_lock)
+            )
         
         self.max_workers = max_workers or self._detect_optimal_workers()
         
-        self._db_lock = threading.Lock()
-        self._connections = {}
-        self._connection_lock = threading.Lock()
+        # Hash noti: quelli già nel database, letti una volta sola, più quelli assegnati in
+        # questa esecuzione (i record arrivano al DB in batch tramite il writer thread).
+        # Il controllo duplicati è una lookup nel set, senza query per file. Con
+        # performance_config.bloom_filter gli hash del database stanno in un filtro di Bloom
+        # (~10 bit per hash, _db_hashes) e solo le risposte "forse" interrogano il database;
+        # il set contiene allora solo gli hash nuovi di questa esecuzione.
+        self._db_hashes = None
+        if config.get("performance_config", {}).get("bloom_filter", False):
+            self._db_hashes = BloomHashSet(db_manager)
+            self._seen_hashes = set()
+        else:
+            self._seen_hashes = db_manager.load_hashes()
+        self._seen_lock = threading.Lock()
+        
+        # Prefiltro per dimensione (performance_config.size_prefilter): un file di dimensione
+        # mai vista non può essere un duplicato, quindi non viene letto per l'hash. _sizes mappa
+        # dimensione -> None (hash già calcolati) o (original_path, path da leggere) dell'unico
+        # file senza hash; al primo file della stessa dimensione quell'hash viene recuperato.
+        # Con sample_hash le stesse voci esistono anche per (dimensione, hash campione).
+        # Stato protetto da _seen_lock, come _seen_hashes.
+        self.size_prefilter = bool(config.get("performance_config", {}).get("size_prefilter", False))
+        self.sample_hash = self.size_prefilter and bool(config.get("performance_config", {}).get("sample_hash", False))
+        self._sizes = db_manager.load_size_index() if self.size_prefilter else {}
+        self._late_hashes = {}
+        self._recorded_without_hash = set()
+        
+        # Copia fusa (performance_config.fused_copy): la lettura per l'hash scrive anche una copia
+        # temporanea nella destinazione, poi spostata nella cartella finale. Solo dove la copia
+        # normale rileggerebbe il file: non con hardlink o clone (stesso filesystem), né con i
+        # processi di analisi. _staged: path sorgente -> copia temporanea in attesa di organizzazione.
+        self.fused_copy = (bool(config.get("performance_config", {}).get("fused_copy", False))
+                           and not dry_run and not same_device and analysis_processes == 0)
+        self._staged = {}
+        
+        # Cache hash della destinazione (pre_scan_destination), letta solo in modalità merge
+        self._hash_cache = {}
+        
+        # Cartelle di destinazione già create: makedirs una sola volta per anno/mese.
+        # Senza lock: nel caso peggiore due thread chiamano makedirs(exist_ok=True) entrambi.
+        self._created_dirs = set()
         
         self._progress_lock = threading.Lock()
+        # Un Counter per thread worker, aggiornato senza lock e sommato in self.stats da merge_stats
+        self._local_stats = threading.local()
+        self._stats_counters = []
         self._processed_count = 0
         self._error_count = 0
         self._duplicate_count = 0
@@ -70,6 +188,7 @@ class FileProcessor:
             'duplicate_files': 0,
             'error_files': 0,
             'unsupported_files': 0,
+            'skipped_files': 0,
             'photos_organized': 0,
             'videos_organized': 0
         }
@@ -77,37 +196,51 @@ class FileProcessor:
         mode_str = " (DRY-RUN)" if self.dry_run else ""
         logging.info(f"FileProcessor inizializzato con {self.max_workers} worker threads{mode_str}")
 
+    def hash_worker_initializer(self):
+        """Initializer dei thread hash: connessione per thread e, se richiesto, un core dedicato."""
+        if self.executor_initializer is not None:
+            self.executor_initializer()
+        if self.pin_hash_workers:
+            cpu = pin_current_thread()
+            logging.debug("Thread %s legato alla CPU %s", threading.current_thread().name, cpu)
+
     def _detect_optimal_workers(self) -> int:
-        cpu_count = os.cpu_count() or 4
-        optimal_workers = min(cpu_count * 2, 16)
+        # Hash ed EXIF sono CPU-bound: più thread che CPU aggiungono solo context switch
+        cpu_count = usable_cpu_count()
+        optimal_workers = min(cpu_count, 16)
         logging.info(f"CPU rilevati: {cpu_count}, worker ottimali: {optimal_workers}")
         return optimal_workers
 
+    @staticmethod
+    def _as_extension_set(extensions: Iterable[str]) -> FrozenSet[str]:
+        """Riusa i frozenset già normalizzati da normalize_extensions; converte liste e set in minuscolo."""
+        if isinstance(extensions, frozenset):
+            return extensions
+        return frozenset(ext.lower() for ext in extensions)
+
     def _get_thread_connection(self):
-        thread_id = threading.get_ident()
-        with self._connection_lock:
-            if thread_id not in self._connections:
-                self._connections[thread_id] = self.db_manager.create_db()
-                logging.debug(f"Nuova connessione DB creata per thread {thread_id}")
-            return self._connections[thread_id]
+        return self.db_manager.get_thread_local_connection()
 
     def _cleanup_connections(self):
-        with self._connection_lock:
-            for thread_id, conn in self._connections.items():
-                try:
-                    conn.close()
-                    logging.debug(f"Connessione DB chiusa per thread {thread_id}")
-                except Exception as e:
-                    logging.warning(f"Errore chiusura connessione thread {thread_id}: {e}")
-            self._connections.clear()
+        self.db_manager.close_thread_connections()
 
-    def pre_scan_destination(self):
+    def pre_scan_destination(self, rebuild_cache: bool = False):
+        """
+        Indicizza i file già in destinazione (modalità merge). Gli hash dei file con mtime e
+        dimensione invariati vengono presi dalla tabella hash_cache; rebuild_cache li ricalcola tutti.
+        """
         print("[MERGE] Inizio pre-scansione della directory di destinazione...")
         logging.info("Inizio pre-scansione della destinazione per la modalità merge.")
+        self._hash_cache = {} if rebuild_cache else self.db_manager.load_hash_cache()
         
+        # DirEntry invece di Path: nome, path e dimensione arrivano già dalla scansione
         try:
-            dest_files = list(self.dest_dir.rglob("*"))
-            files_to_hash = [f for f in dest_files if f.is_file() and self._is_supported_file(f)]
+            files_to_hash = [
+                entry for entry in self._iter_files(self.dest_dir, apply_exclusions=False)
+                if os.path.splitext(entry.name)[1].lower() in self.supported_extensions
+            ]
+            # Prima i file più grandi (LPT): un video da diversi GB non resta l'ultimo a occupare un thread
+            files_to_hash.sort(key=lambda entry: entry.stat().st_size, reverse=True)
         except Exception as e:
             print(f"[ERROR] Impossibile leggere la directory di destinazione: {e}")
             logging.error(f"Errore durante la scansione della destinazione: {e}")
@@ -121,185 +254,422 @@ class FileProcessor:
         total_files_to_index = len(files_to_hash)
         print(f"[MERGE] Trovati {total_files_to_index} file esistenti da indicizzare con {self.max_workers} thread...")
         
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_file = {
-                executor.submit(self._hash_and_record_existing_file, file_path): file_path
-                for file_path in files_to_hash
-            }
-            
-            for future in tqdm(as_completed(future_to_file), total=len(files_to_hash), desc="Indicizzazione destinazione", unit="file"):
-                file_path = future_to_file[future]
+        # Coda limitata consumata da max_workers task lunghi: niente future per file
+        # né as_completed, e la barra si aggiorna a blocchi di _PROGRESS_BATCH file
+        entry_queue = queue.Queue(maxsize=2 * self.max_workers)
+        pbar = tqdm(total=total_files_to_index, desc="Indicizzazione destinazione", unit="file", mininterval=0.1)
+        pbar_lock = threading.Lock()
+        
+        def index_worker():
+            done = 0
+            while True:
+                entry = entry_queue.get()
+                if entry is None:
+                    break
                 try:
-                    future.result()
+                    self._hash_and_record_existing_file(entry)
                 except Exception as e:
-                    logging.error(f"Errore durante l'indicizzazione del file di destinazione {file_path}: {e}")
+                    logging.error(f"Errore durante l'indicizzazione del file di destinazione {entry.path}: {e}")
+                done += 1
+                if done == _PROGRESS_BATCH:
+                    with pbar_lock:
+                        pbar.update(done)
+                    done = 0
+            with pbar_lock:
+                pbar.update(done)
+        
+        executor = get_executor(self.max_workers)
+        workers = [executor.submit(index_worker) for _ in range(self.max_workers)]
+        for entry in files_to_hash:
+            entry_queue.put(entry)
+        for _ in workers:
+            entry_queue.put(None)
+        wait(workers)
+        pbar.close()
         
+        self.db_manager.flush()
         print(f"\n[MERGE] Pre-scansione della destinazione completata.")
         logging.info(f"Pre-scansione completata.")
 
-    def _hash_and_record_existing_file(self, file_path: Path):
+    def _hash_and_record_existing_file(self, entry: os.DirEntry):
+        file_path = entry.path
         try:
-            conn = self._get_thread_connection()
-            _, file_hash = HashUtils.compute_hash(file_path, self.config)
+            st = entry.stat()
+            file_size, mtime_ns = st.st_size, st.st_mtime_ns
+            cached = self._hash_cache.get(file_path)
+            if cached is not None and cached[0] == mtime_ns and cached[1] == file_size:
+                file_hash = cached[2]
+            else:
+                _, file_hash = HashUtils.compute_hash(file_path, self.config)
+                if file_hash:
+                    self.db_manager.enqueue_hash_cache(file_path, mtime_ns, file_size, file_hash)
+            if self.size_prefilter:
+                with self._seen_lock:
+                    self._sizes[file_size] = None
             
-            if file_hash and not self._is_duplicate(file_hash, conn):
-                media_type = "PHOTO" if file_path.suffix.lower() in self.image_extensions else "VIDEO"
+            if file_hash and not self._is_duplicate(file_hash):
+                media_type = self.media_type_for(os.path.splitext(entry.name)[1].lower())
                 
+                # original_path è UNIQUE: per i file già in destinazione si usa il loro path
                 record = (
-                    "N/A (existing file)", file_hash, "N/A", "N/A", media_type,
-                    "EXISTING", str(file_path), file_path.name
+                    file_path, file_hash, "N/A", "N/A", media_type,
+                    "EXISTING", file_path, entry.name, file_size
                 )
-                with self._db_lock:
-                    self.db_manager.insert_file(conn, record)
+                self.db_manager.enqueue_file(record)
         except Exception as e:
             logging.warning(f"Impossibile indicizzare il file esistente {file_path}: {e}")
             raise
 
-    def scan_directory(self):
-        mode_str = " (modalità DRY-RUN)" if self.dry_run else ""
-        logging.info(f"Inizio scansione directory{mode_str}: {self.source_dir}")
-        
-        files_to_process = self._collect_files()
-        
-        if not files_to_process:
-            logging.warning("Nessun file trovato da processare")
-            print("[WARN] Nessun file nuovo trovato nella directory sorgente.")
-            return
-        
-        self.stats['total_files'] = len(files_to_process)
-        logging.info(f"Trovati {len(files_to_process)} file da processare{mode_str}")
-        
-        print(f"[{'DRY-RUN' if self.dry_run else 'INFO'}] Trovati {len(files_to_process)} file da processare con {self.max_workers} thread paralleli")
-        
-        self._process_files_parallel(files_to_process)
-        
+    def finish_scan(self):
+        """Scrive i record in coda, chiude le connessioni e stampa il riepilogo della sessione."""
+        self.merge_stats()
+        for staged in self._staged.values():
+            # Copie temporanee di file mai organizzati (pipeline interrotta)
+            FileUtils.discard(staged)
+        self._staged.clear()
+        self.db_manager.flush_and_join()
         self._cleanup_connections()
         self._print_final_stats()
 
-    def _collect_files(self) -> List[Path]:
-        files_to_process = []
-        print(f"[{'DRY-RUN' if self.dry_run else 'SCAN'}] Scansione directory sorgente in corso...")
-        
-        conn = self._get_thread_connection()
+    def scan_directory(self):
+        """
+        Elabora la sorgente con una FilePipeline: visita, hash e copia si sovrappongono
+        attraverso code limitate, senza materializzare la lista dei file.
+        """
+        FilePipeline(
+            self,
+            hash_workers=usable_cpu_count(),
+            write_workers=self.max_workers,
+            queue_depth=max(self.max_workers, usable_cpu_count()) * 4
+        ).run()
+
+    def iter_source_files(self):
+        """
+        Generatore dei file supportati della sorgente; i file non supportati
+        vengono registrati nel database durante la visita.
+        """
         try:
-            for root_path in self.source_dir.rglob("*"):
-                if self._should_skip_path(root_path):
-                    continue
-                
-                if self._is_supported_file(root_path):
-                    files_to_process.append(root_path)
-                elif root_path.is_file():
-                    with self._db_lock:
-                        self.db_manager.insert_unprocessed_file(conn, str(root_path), "unsupported", f"Estensione non supportata: {root_path.suffix}")
+            for entry in self._iter_files(self.source_dir):
+                file_path = self.accept_source_entry(entry)
+                if file_path is not None:
+                    yield file_path
         except Exception as e:
             logging.error(f"Errore durante la raccolta file: {e}")
             raise
-        
-        return files_to_process
 
-    def _process_files_parallel(self, files: List[Path]):
-        mode_str = " (DRY-RUN)" if self.dry_run else ""
-        logging.info(f"Inizio processing parallelo{mode_str} con {self.max_workers} workers")
-        
-        print(f"[{'DRY-RUN' if self.dry_run else 'START'}] Inizio processing {len(files)} file con {self.max_workers} worker paralleli...")
-        
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            future_to_file = {
-                executor.submit(self._process_single_file, file_path): file_path
-                for file_path in files
-            }
-            
-            pbar_desc = "Simulazione" if self.dry_run else "Elaborazione"
-            for future in tqdm(as_completed(future_to_file), total=len(files), desc=pbar_desc, unit="file"):
-                file_path = future_to_file[future]
-                try:
-                    result = future.result()
-                    with self._progress_lock:
-                        if result['status'] == 'duplicate':
-                            self.stats['duplicate_files'] += 1
-                        elif result['status'] in ['copied', 'simulated']:
-                            if result['media_type'] == 'PHOTO':
-                                self.stats['photos_organized'] += 1
-                            else:
-                                self.stats['videos_organized'] += 1
-                            self.stats['processed_files'] += 1
-                        elif result['status'] == 'error':
-                            self.stats['error_files'] += 1
-                except Exception as e:
-                    logging.error(f"Errore processing {file_path}: {e}")
-                    with self._progress_lock:
-                        self.stats['error_files'] += 1
-        
-        print(f"\n[{'DRY-RUN' if self.dry_run else 'SUCCESS'}] Processing completato.")
+    def accept_source_entry(self, entry: os.DirEntry) -> Optional[Path]:
+        """Path del file se l'estensione è supportata; altrimenti lo registra come non supportato."""
+        suffix = os.path.splitext(entry.name)[1]
+        if suffix.lower() in self.supported_extensions:
+            return Path(entry.path)
+        self.db_manager.enqueue_unprocessed_file(entry.path, "unsupported", f"Estensione non supportata: {suffix}")
+        return None
 
-    def _process_single_file(self, file_path: Path) -> Dict[str, Any]:
+    def scan_dir(self, current: str, apply_exclusions: bool = True) -> Tuple[List[str], List[os.DirEntry]]:
+        """
+        Un livello della visita con os.scandir: sottocartelle da visitare e file trovati.
+        I DirEntry riusano il tipo restituito da readdir, senza una stat per voce;
+        le cartelle escluse vengono potate prima di scenderci.
+        """
+        subdirs, files = [], []
         try:
-            conn = self._get_thread_connection()
-            media_type = "PHOTO" if file_path.suffix.lower() in self.image_extensions else "VIDEO"
-            _, file_hash = HashUtils.compute_hash(file_path, self.config)
-            
-            date_info = DateExtractor.extract_date(file_path, self.image_extensions, self.video_extensions)
-            year, month = (date_info[0], date_info[1]) if date_info else ("Unknown", "Unknown")
-            
-            status = self._organize_file(file_path, media_type, year, month, file_hash, conn)
-            
-            return {'status': status, 'media_type': media_type, 'file_path': str(file_path)}
-        except Exception as e:
-            logging.error(f"Errore processing file {file_path}: {e}")
-            with self._db_lock:
-                conn = self._get_thread_connection()
-                self.db_manager.insert_unprocessed_file(conn, str(file_path), "error", str(e))
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if apply_exclusions and self._is_excluded(entry):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.is_file():
+                        files.append(entry)
+        except PermissionError as e:
+            logging.warning(f"Directory non leggibile, ignorata: {current} ({e})")
+        return subdirs, files
+
+    def _iter_files(self, root: Path, apply_exclusions: bool = True):
+        """Visita iterativa (stack esplicito) di scan_dir: genera i DirEntry dei file."""
+        stack = [str(root)]
+        while stack:
+            subdirs, files = self.scan_dir(stack.pop(), apply_exclusions)
+            stack.extend(subdirs)
+            yield from files
+
+    def record_result(self, status: str, media_type: Optional[str] = None):
+        """Conta l'esito di un file nel Counter del thread corrente (nessun lock per file)."""
+        counts = getattr(self._local_stats, "counts", None)
+        if counts is None:
+            counts = self._local_stats.counts = Counter()
+            with self._progress_lock:
+                self._stats_counters.append(counts)
+        if status in ('copied', 'simulated'):
+            counts['processed_files'] += 1
+            counts['photos_organized' if media_type == 'PHOTO' else 'videos_organized'] += 1
+        elif status in _STATUS_STATS:
+            counts[_STATUS_STATS[status]] += 1
+
+    def merge_stats(self):
+        """Somma i contatori dei thread in self.stats; da chiamare a worker terminati."""
+        with self._progress_lock:
+            totals = sum(self._stats_counters, Counter())
+        for key in ('processed_files', 'photos_organized', 'videos_organized',
+                    'duplicate_files', 'error_files', 'skipped_files'):
+            self.stats[key] = totals[key]
+
+    def media_type_for(self, suffix: str) -> str:
+        """Tipo media ("PHOTO"/"VIDEO") per un'estensione già minuscola."""
+        return self._ext_to_media.get(suffix, "VIDEO")
+
+    def is_recorded(self, file_path: Path) -> bool:
+        """True se il file è già nel database da una sessione precedente: si salta hash ed EXIF."""
+        return not self.dry_run and self.db_manager.exists(str(file_path), self._get_thread_connection())
+
+    def analyze_file(self, file_path: Path) -> Tuple[str, str, str, Optional[str], int]:
+        """Calcola tipo, anno, mese, hash e dimensione di un file (fase CPU/lettura, senza scritture)."""
+        path_str = str(file_path)
+        suffix = os.path.splitext(path_str)[1].lower()
+        media_type = self.media_type_for(suffix)
+        file_size = os.stat(path_str).st_size
+        need_hash = self._claim_size(file_size, path_str) if self.size_prefilter else True
+        if self.fused_copy and need_hash:
+            file_hash, date_info = self._analyze_and_stage(file_path, path_str, suffix)
+        elif self._analysis_pool is not None:
+            file_hash, date_info = self._analysis_pool.submit(
+                analyze_in_worker, file_path,
+                self.image_extensions, self.video_extensions, suffix, need_hash
+            ).result()
+        else:
+            file_hash, date_info = analyze_in_worker(file_path, self.image_extensions, self.video_extensions,
+                                                     suffix, need_hash)
+        year, month = (date_info[0], date_info[1]) if date_info else ("Unknown", "Unknown")
+        return media_type, year, month, file_hash, file_size
+
+    def _analyze_and_stage(self, file_path: Path, path_str: str, suffix: str):
+        """Come analyze_in_worker, copiando il file in una copia temporanea della destinazione durante l'hash."""
+        header_bytes = EXIF_HEADER_BYTES if suffix in EXIF_HEADER_SUFFIXES and suffix in self.image_extensions else 0
+        fd, staged = tempfile.mkstemp(prefix=".photoorg_", suffix=".part", dir=self.dest_dir)
+        try:
+            with os.fdopen(fd, "wb") as out:
+                file_hash, header = HashUtils.compute_hash_and_header(file_path, header_bytes, copy_to=out)
+        except BaseException:
+            FileUtils.discard(staged)
             raise
+        if file_hash is None:
+            # Copia non riuscita: il file verrà copiato normalmente
+            FileUtils.discard(staged)
+        else:
+            self._staged[path_str] = staged
+        return file_hash, extract_date(file_path, self.image_extensions, self.video_extensions,
+                                       suffix, header if header_bytes else None)
+
+    def _claim_size(self, file_size: int, original_path: str) -> bool:
+        """
+        Registra la dimensione di un file e dice se serve il suo hash. Se un solo file di questa
+        dimensione era stato registrato senza hash, il suo hash viene calcolato ora, prima che
+        il chiamante controlli i duplicati. Con sample_hash, a parità di dimensione si confronta
+        prima l'hash di inizio e fine file: l'hash completo serve solo se anche quello coincide.
+        """
+        state = self._claim(file_size, original_path, self._resolve_pending_size)
+        if state is _NEW:
+            return False
+        if state is not _SAMPLED:
+            return True
+        sample = HashUtils.compute_sample_hash(original_path)
+        if sample is None:
+            return True
+        return self._claim((file_size, sample), original_path, self._resolve_pending_hash) is not _NEW
+
+    def _claim(self, key, original_path: str, resolve):
+        """
+        Registra il file sotto key. Ritorna _NEW se key era libera (il file resta senza hash),
+        altrimenti lo stato di key dopo aver risolto (resolve) o atteso il file in sospeso:
+        None (hash completi noti) o _SAMPLED (confronto per hash campione).
+        """
+        with self._seen_lock:
+            if key not in self._sizes:
+                self._sizes[key] = (original_path, original_path)
+                return _NEW
+            pending = self._sizes[key]
+            if isinstance(pending, tuple):
+                # Gli altri file con la stessa key attendono che il file in sospeso sia risolto
+                resolved = self._sizes[key] = threading.Event()
+        if isinstance(pending, tuple):
+            state = None
+            try:
+                state = resolve(key, *pending)
+            finally:
+                with self._seen_lock:
+                    self._sizes[key] = state
+                resolved.set()
+            return state
+        if isinstance(pending, threading.Event):
+            pending.wait()
+            with self._seen_lock:
+                return self._sizes[key]
+        return pending
 
-    def _organize_file(self, file_path: Path, media_type: str, year: str, month: str, file_hash: str, conn) -> str:
+    def _resolve_pending_size(self, file_size: int, original_path: str, read_path: str):
+        """
+        Risolve il file in sospeso per dimensione: con sample_hash lo sposta al livello
+        (dimensione, hash campione) e ritorna _SAMPLED, altrimenti ne calcola l'hash completo.
+        """
+        if self.sample_hash:
+            sample = HashUtils.compute_sample_hash(read_path)
+            if sample is not None:
+                with self._seen_lock:
+                    self._sizes[(file_size, sample)] = (original_path, read_path)
+                return _SAMPLED
+        return self._resolve_pending_hash(file_size, original_path, read_path)
+
+    def _resolve_pending_hash(self, key, original_path: str, read_path: str):
+        """Calcola l'hash di un file registrato senza hash e lo porta nel set e nel database."""
+        _, file_hash = HashUtils.compute_hash(read_path, self.config)
+        if not file_hash:
+            return
+        with self._seen_lock:
+            # Dimensione unica fino a ora: è la prima copia di questo contenuto
+            self._seen_hashes.add(file_hash)
+            if original_path in self._recorded_without_hash or original_path != read_path:
+                # Record già accodato (questa sessione) o già scritto (sessione precedente)
+                self._recorded_without_hash.discard(original_path)
+                self.db_manager.enqueue_hash_update(original_path, file_hash)
+            else:
+                # Record non ancora accodato: lo raccoglie _enqueue_record
+                self._late_hashes[original_path] = file_hash
+        return None
+
+    def _enqueue_record(self, record: Tuple[Any, ...]):
+        """Accoda il record di un file organizzato, completando l'hash calcolato in ritardo."""
+        if record[1] is not None or not self.size_prefilter:
+            self.db_manager.enqueue_file(record)
+            return
+        # Accodamento sotto lock: l'eventuale UPDATE di _resolve_pending_hash segue sempre l'insert
+        with self._seen_lock:
+            late_hash = self._late_hashes.pop(record[0], None)
+            if late_hash is None:
+                self._recorded_without_hash.add(record[0])
+            else:
+                record = (record[0], late_hash) + record[2:]
+            self.db_manager.enqueue_file(record)
+
+    def organize_analyzed_file(self, file_path: Path, media_type: str, year: str, month: str,
+                               file_hash: Optional[str], file_size: Optional[int] = None) -> str:
+        """Copia (o simula) un file già analizzato e ne accoda il record; ritorna lo status."""
+        status = self._organize_file(file_path, media_type, year, month, file_hash, file_size)
+        logging.debug("%s -> %s (%s %s/%s)", file_path, status, media_type, year, month)
+        return status
+
+    def _target_dir(self, media_type: str, year: str, month: str, is_duplicate: bool) -> Path:
+        """Cartella di destinazione di un file: duplicati, ToReview o anno/mese."""
+        if is_duplicate:
+            return self.dest_dir / f"{media_type}_DUPLICATES"
+        if year == "Unknown":
+            return self.dest_dir / "ToReview" / media_type
+        return self.dest_dir / media_type / year / month
+
+    def _organize_file_real(self, file_path: Path, media_type: str, year: str, month: str,
+                            file_hash: Optional[str], file_size: Optional[int] = None) -> str:
+        """Copia il file nella destinazione e ne accoda il record (assegnato a _organize_file)."""
+        staged = self._staged.pop(str(file_path), None) if self.fused_copy else None
         try:
-            dest_dir = self.dest_dir / "ToReview" / media_type if year == "Unknown" else self.dest_dir / media_type / year / month
-            is_duplicate = self._is_duplicate(file_hash, conn)
-            
-            status = "duplicate" if is_duplicate else ("simulated" if self.dry_run else "copied")
-            
-            if not self.dry_run:
-                target_dir = self.dest_dir / f"{media_type}_DUPLICATES" if is_duplicate else dest_dir
-                target_dir.mkdir(parents=True, exist_ok=True)
-                final_path = FileUtils.safe_copy(file_path, target_dir, file_path.name)
+            is_duplicate = self._is_duplicate(file_hash)
+            target_dir = self._target_dir(media_type, year, month, is_duplicate)
+            self._ensure_dir(target_dir)
+            if staged is not None:
+                final_path = FileUtils.place_staged(staged, file_path, target_dir, file_path.name)
             else:
-                final_path = (self.dest_dir / f"{media_type}_DUPLICATES" if is_duplicate else dest_dir) / file_path.name
+                final_path = FileUtils.safe_copy(file_path, target_dir, file_path.name,
+                                                 self.copy_strategy, self.same_device)
+            status = "duplicate" if is_duplicate else "copied"
+            self._enqueue_record((
+                str(file_path), file_hash, year, month, media_type,
+                status, str(final_path), final_path.name, file_size
+            ))
+            return status
+        except Exception as e:
+            if staged is not None:
+                FileUtils.discard(staged)
+            return self._organize_error(file_path, e)
 
-            with self._db_lock:
-                record = (
-                    str(file_path), file_hash, year, month, media_type,
-                    status, str(final_path), final_path.name
-                )
-                self.db_manager.insert_file(conn, record)
+    def _organize_file_dry(self, file_path: Path, media_type: str, year: str, month: str,
+                           file_hash: Optional[str], file_size: Optional[int] = None) -> str:
+        """Simula l'organizzazione: calcola la destinazione e accoda il record, senza copie."""
+        try:
+            is_duplicate = self._is_duplicate(file_hash)
+            name = file_path.name
+            final_path = self._target_dir(media_type, year, month, is_duplicate) / name
+            status = "duplicate" if is_duplicate else "simulated"
+            self._enqueue_record((
+                str(file_path), file_hash, year, month, media_type,
+                status, str(final_path), name, file_size
+            ))
             return status
         except Exception as e:
-            logging.error(f"Errore organizzazione file {file_path}: {e}")
-            with self._db_lock:
-                self.db_manager.insert_unprocessed_file(conn, str(file_path), "error", str(e))
-            return "error"
+            return self._organize_error(file_path, e)
 
-    def _is_duplicate(self, file_hash: str, conn) -> bool:
-        if not file_hash: return False
-        cursor = conn.cursor()
-        cursor.execute("SELECT COUNT(*) FROM files WHERE hash = ?", (file_hash,))
-        return cursor.fetchone()[0] > 0
+    def _organize_error(self, file_path: Path, error: Exception) -> str:
+        logging.error("Errore organizzazione file %s: %s", file_path, error)
+        self.db_manager.enqueue_unprocessed_file(str(file_path), "error", str(error))
+        return "error"
 
-    def _should_skip_path(self, path: Path) -> bool:
-        return any(part.startswith('.') for part in path.parts if self.exclude_hidden_dirs) or \
-               any(pattern in str(path) for pattern in self.exclude_patterns)
+    def prime_dest_tree(self):
+        """
+        Registra in _created_dirs le cartelle anno/mese già presenti nella destinazione
+        (qualche scandir sui primi livelli), così nelle esecuzioni successive i file
+        destinati a cartelle esistenti non chiamano makedirs. Non crea cartelle vuote.
+        """
+        roots = [self.dest_dir / "PHOTO", self.dest_dir / "VIDEO",
+                 self.dest_dir / "PHOTO_DUPLICATES", self.dest_dir / "VIDEO_DUPLICATES",
+                 self.dest_dir / "ToReview" / "PHOTO", self.dest_dir / "ToReview" / "VIDEO"]
+        for root in roots:
+            pending = [(str(root), 0)]
+            while pending:
+                current, depth = pending.pop()
+                try:
+                    with os.scandir(current) as entries:
+                        self._created_dirs.add(current)
+                        if depth < 2:
+                            pending.extend((entry.path, depth + 1) for entry in entries
+                                           if entry.is_dir(follow_symlinks=False))
+                except (FileNotFoundError, NotADirectoryError):
+                    pass
+        logging.info(f"Cartelle di destinazione già presenti: {len(self._created_dirs)}")
+
+    def _ensure_dir(self, directory: Path):
+        key = str(directory)
+        if key not in self._created_dirs:
+            os.makedirs(key, exist_ok=True)
+            self._created_dirs.add(key)
+
+    def _is_duplicate(self, file_hash: str) -> bool:
+        """Verifica se l'hash è già noto; in caso contrario lo registra come visto (check-and-set atomico)."""
+        if not file_hash: return False
+        # Filtro e conferma SQL fuori dal lock: _seen_lock serve anche al prefiltro per dimensione
+        if self._db_hashes is not None and file_hash in self._db_hashes:
+            return True
+        with self._seen_lock:
+            if file_hash in self._seen_hashes:
+                return True
+            self._seen_hashes.add(file_hash)
+            return False
 
-    def _is_supported_file(self, file_path: Path) -> bool:
-        return file_path.is_file() and file_path.suffix.lower() in self.supported_extensions
+    def _is_excluded(self, entry: os.DirEntry) -> bool:
+        return (self.exclude_hidden_dirs and entry.name.startswith('.')) or \
+               (self._exclude_re is not None and self._exclude_re.search(entry.path) is not None)
 
     def _print_final_stats(self):
         mode_str = " (DRY-RUN)" if self.dry_run else ""
         logging.info(f"Statistiche finali{mode_str}: {self.stats}")
         
-        print(f"\n[{'DRY-RUN' if self.dry_run else 'STATS'}] Riepilogo Elaborazione:")
         stats = self.stats
-        print(f"[SUCCESS] File processati: {stats['processed_files']}")
-        print(f"[PHOTO] Foto organizzate: {stats['photos_organized']}")
-        print(f"[VIDEO] Video organizzati: {stats['videos_organized']}")
-        print(f"[DUP] Duplicati gestiti: {stats['duplicate_files']}")
+        parts = [
+            f"\n[{'DRY-RUN' if self.dry_run else 'STATS'}] Riepilogo Elaborazione:",
+            f"[SUCCESS] File processati: {stats['processed_files']}",
+            f"[PHOTO] Foto organizzate: {stats['photos_organized']}",
+            f"[VIDEO] Video organizzati: {stats['videos_organized']}",
+            f"[DUP] Duplicati gestiti: {stats['duplicate_files']}",
+        ]
+        if stats['skipped_files'] > 0:
+            parts.append(f"[SKIP] Già registrati in sessioni precedenti: {stats['skipped_files']}")
         if stats['error_files'] > 0:
-            print(f"[ERROR] Errori: {stats['error_files']}")
\ No newline at end of file
+            parts.append(f"[ERROR] Errori: {stats['error_files']}")
+        sys.stdout.write("\n".join(parts) + "\n")
+        sys.stdout.flush()
\ No newline at end of file
@@ -1,20 +1,258 @@
+import atexit
+import functools
+import itertools
+import multiprocessing
+import os
 import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ioctl FICLONE (Linux): clone copy-on-write dell'intero file su btrfs/xfs
+_FICLONE = 0x40049409
+_reflink_supported = fcntl is not None
+
+_executor = None
+_executor_workers = 0
+_executor_lock = threading.Lock()
+_process_executor = None
+_pin_lock = threading.Lock()
+_pin_next = 0
+
+
+@functools.lru_cache(maxsize=1 << 15)
+def cached_stat(path_str):
+    """Una sola os.stat per path (memoizzata); None se il path non esiste."""
+    try:
+        return os.stat(path_str)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def clear_stat_cache():
+    """Invalida la cache di cached_stat dopo operazioni che modificano il filesystem."""
+    cached_stat.cache_clear()
+
+
+def usable_cpu_count():
+    """CPU effettivamente utilizzabili dal processo (affinità/cgroup/taskset su Linux), altrimenti os.cpu_count()."""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 4
+
+
+def pin_current_thread():
+    """
+    Lega il thread chiamante a una sola CPU tra quelle utilizzabili, a rotazione (Linux:
+    sched_setaffinity(0) agisce sul thread corrente). Ritorna la CPU scelta, None se non supportato.
+    """
+    global _pin_next
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return None
+    with _pin_lock:
+        cpu = cpus[_pin_next % len(cpus)]
+        _pin_next += 1
+    try:
+        os.sched_setaffinity(0, {cpu})
+    except OSError:
+        return None
+    return cpu
+
+
+def get_executor(workers):
+    """
+    ThreadPoolExecutor condiviso dalle fasi a task brevi (preload, reset, pre-scansione,
+    processing): i thread vengono creati una volta sola per esecuzione.
+    Se una fase chiede più thread del pool corrente (es. i worker a lunga vita della
+    pre-scansione), il pool viene sostituito da uno più grande: il vecchio completa i task
+    già inviati e poi si chiude.
+    """
+    global _executor, _executor_workers
+    with _executor_lock:
+        if _executor is None or workers > _executor_workers:
+            if _executor is not None:
+                _executor.shutdown(wait=False)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photoorg")
+            _executor_workers = workers
+        return _executor
+
+
+def get_process_executor(workers, initializer=None, initargs=()):
+    """
+    ProcessPoolExecutor condiviso per il lavoro CPU-bound in Python puro (estrazione date),
+    fuori dal GIL. Contesto spawn: i figli non ereditano i thread e i lock del padre.
+    """
+    global _process_executor
+    with _executor_lock:
+        if _process_executor is None:
+            _process_executor = ProcessPoolExecutor(max_workers=workers,
+                                                    mp_context=multiprocessing.get_context("spawn"),
+                                                    initializer=initializer, initargs=initargs)
+        return _process_executor
+
+
+@atexit.register
+def shutdown_executor():
+    """Attende i task in corso e chiude i pool condivisi."""
+    global _executor, _executor_workers, _process_executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+        _executor_workers = 0
+        process_executor, _process_executor = _process_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+    if process_executor is not None:
+        process_executor.shutdown(wait=True)
+
+
+COPY_STRATEGIES = ("copy_file_range", "sendfile", "shutil", "hardlink")
+
+
 class FileUtils:
     @staticmethod
-    def safe_copy(src_path, dest_dir, base_name):
-        dest_file = Path(dest_dir) / base_name
-        counter = 1
-        while dest_file.exists():
-            stem, suffix = dest_file.stem, dest_file.suffix
-            dest_file = Path(dest_dir) / f"{stem}__{counter}{suffix}"
-            counter += 1
-        shutil.copy2(src_path, dest_file)
+    def safe_copy(src_path, dest_dir, base_name, strategy="shutil", same_device=False):
+        """
+        Copia src_path in dest_dir come base_name, o stem__N.ext se il nome è occupato.
+        Il nome viene riservato con open(O_CREAT|O_EXCL) (o dal link stesso): atomico tra
+        thread concorrenti e senza una stat per candidato. Ritorna il path finale.
+        """
+        stem, suffix = os.path.splitext(base_name)
+        for counter in itertools.count():
+            dest_file = Path(dest_dir) / (base_name if counter == 0 else f"{stem}__{counter}{suffix}")
+            if strategy == "hardlink" and same_device:
+                try:
+                    os.link(src_path, dest_file)
+                    return dest_file
+                except FileExistsError:
+                    continue
+                except OSError:
+                    strategy = "copy_file_range"
+            try:
+                os.close(os.open(dest_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+                break
+            except FileExistsError:
+                continue
+        try:
+            FileUtils.copy_file(src_path, dest_file, strategy, same_device)
+        except BaseException:
+            # Niente file vuoti o parziali con il nome riservato
+            try:
+                os.unlink(dest_file)
+            except OSError:
+                pass
+            raise
+        return dest_file
+
+    @staticmethod
+    def place_staged(staged_path, src_path, dest_dir, base_name):
+        """
+        Porta in dest_dir una copia già scritta in staged_path (stesso filesystem) con i
+        metadati di src_path: il nome è riservato come in safe_copy, poi os.replace lo occupa.
+        """
+        shutil.copystat(src_path, staged_path)
+        stem, suffix = os.path.splitext(base_name)
+        for counter in itertools.count():
+            dest_file = Path(dest_dir) / (base_name if counter == 0 else f"{stem}__{counter}{suffix}")
+            try:
+                os.close(os.open(dest_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644))
+                break
+            except FileExistsError:
+                continue
+        try:
+            os.replace(staged_path, dest_file)
+        except BaseException:
+            os.unlink(dest_file)
+            raise
         return dest_file
 
+    @staticmethod
+    def discard(path):
+        """Rimuove un file temporaneo, ignorando gli errori (già rimosso, permessi)."""
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def copy_file(src_path, dest_file, strategy="shutil", same_device=False):
+        """
+        Copia contenuto e metadati. "copy_file_range" usa la copia in kernel (reflink/CoW
+        su btrfs/xfs), "sendfile" evita i buffer user-space; in caso di errore si prosegue
+        con la strategia successiva dall'offset già copiato, fino a shutil.
+        Con sorgente e destinazione sullo stesso filesystem (same_device) si tenta prima
+        un clone FICLONE, che è una sola operazione sui metadati; "hardlink" crea invece
+        un hard link (stesso inode della sorgente) e ripiega sulla copia se non è possibile.
+        """
+        global _reflink_supported
+
+        if strategy == "hardlink":
+            if same_device:
+                try:
+                    os.link(src_path, dest_file)
+                    return
+                except OSError:
+                    pass
+            strategy = "copy_file_range"
+
+        if strategy == "shutil":
+            shutil.copy2(src_path, dest_file)
+            return
+
+        with open(src_path, "rb") as fsrc, open(dest_file, "wb") as fdst:
+            in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+            size = os.fstat(in_fd).st_size
+            offset = 0
+
+            if same_device and _reflink_supported:
+                try:
+                    fcntl.ioctl(out_fd, _FICLONE, in_fd)
+                    offset = size
+                except OSError:
+                    # Filesystem senza reflink: non ritentare per i file successivi
+                    _reflink_supported = False
+
+            if strategy == "copy_file_range" and hasattr(os, "copy_file_range"):
+                try:
+                    while offset < size:
+                        copied = os.copy_file_range(in_fd, out_fd, size - offset, offset, offset)
+                        if copied == 0:
+                            break
+                        offset += copied
+                except OSError:
+                    pass
+
+            if offset < size and hasattr(os, "sendfile"):
+                try:
+                    os.lseek(out_fd, offset, os.SEEK_SET)
+                    while offset < size:
+                        copied = os.sendfile(out_fd, in_fd, offset, size - offset)
+                        if copied == 0:
+                            break
+                        offset += copied
+                except OSError:
+                    pass
+
+            if offset < size:
+                fsrc.seek(offset)
+                fdst.seek(offset)
+                shutil.copyfileobj(fsrc, fdst)
+
+            if hasattr(os, "posix_fadvise"):
+                # Sorgente letta per hash e copia, non servirà più: libera la page cache
+                # invece di far uscire pagine utili (database, cartelle) su macchine con poca RAM
+                os.posix_fadvise(in_fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+        shutil.copystat(src_path, dest_file)
+
     @staticmethod
     def available_space(path):
-        import os
         stat = os.statvfs(str(path))
-        return stat.f_bavail * stat.f_frsize
\ No newline at end of file
+        return stat.f_bavail * stat.f_frsize
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Hash Index for PhotoOrg
+Filtro di Bloom davanti al database per il controllo duplicati su archivi molto grandi:
+~10 bit per hash invece di ~100 byte di una stringa esadecimale in un set.
+"""
+
+import logging
+import math
+
+
+class BloomHashSet:
+    """
+    Hash già registrati nel database, tenuti solo in un filtro di Bloom: per `in` un "no"
+    è certo, un "forse" viene confermato con una SELECT indicizzata. Il filtro è di sola
+    lettura dopo la costruzione, quindi `in` è thread-safe e va chiamato fuori dai lock.
+    Gli hash nuovi di questa esecuzione non passano di qui (vedi FileProcessor._is_duplicate).
+    """
+
+    BITS_PER_ENTRY = 10                  # ~1% di falsi positivi con 7 funzioni hash
+    NUM_HASHES = 7
+
+    def __init__(self, db_manager):
+        self.db_manager = db_manager
+        capacity = max(db_manager.count_hashes(), 1024)
+        self._num_bits = capacity * self.BITS_PER_ENTRY
+        self._bits = bytearray(math.ceil(self._num_bits / 8))
+        for file_hash in db_manager.iter_hashes():
+            for position in self._positions(file_hash):
+                self._bits[position >> 3] |= 1 << (position & 7)
+        logging.info(f"Filtro di Bloom degli hash: {capacity} voci, {len(self._bits) >> 10} KB")
+
+    def _positions(self, file_hash: str):
+        # Gli hash sono già uniformi: due blocchi da 64 bit del digest bastano (double hashing)
+        h1 = int(file_hash[-16:], 16)
+        h2 = int(file_hash[-32:-16], 16) | 1
+        return ((h1 + i * h2) % self._num_bits for i in range(self.NUM_HASHES))
+
+    def might_contain(self, file_hash: str) -> bool:
+        """Solo il filtro, senza database: False è certo, True può essere un falso positivo."""
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(file_hash))
+
+    def __contains__(self, file_hash: str) -> bool:
+        return self.might_contain(file_hash) and self.db_manager.has_hash(file_hash)
+
+
+__all__ = ['BloomHashSet']
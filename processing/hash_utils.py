@@ -1,273 +1,231 @@
 # -*- coding: utf-8 -*-
 """
-GPU-Enhanced Hash Utils for PhotoOrg v2.0
-Implementazione completa basata sui test con 4.5x speedup dimostrato
-MODIFICATO: Reso consapevole della configurazione esterna per la decisione GPU/CPU.
+Hash Utils for PhotoOrg
+SHA-256 (o BLAKE3, opzionale) in streaming sulla CPU per il rilevamento dei duplicati,
+più un hash campione veloce (inizio + fine file) usato dal prefiltro per dimensione.
 """
 
 import hashlib
 import logging
-import time
-from pathlib import Path
-from typing import Union, Tuple, List, Optional, Dict, Any
+import mmap
+import os
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Union, Tuple, Optional, Dict, Any
 
-# GPU imports (optional)
+# BLAKE3 (optional): pip install blake3
 try:
-    import cupy as cp
-    HARDWARE_GPU_AVAILABLE = True
-    logging.info("🚀 GPU (CuPy) rilevata a livello hardware.")
+    import blake3 as _blake3
 except ImportError:
-    HARDWARE_GPU_AVAILABLE = False
-    logging.info("⚠️ GPU (CuPy) non rilevata a livello hardware. L'hashing GPU sarà disabilitato.")
+    _blake3 = None
+
+# hashlib.file_digest (Python 3.11+): il ciclo read/update gira in C e rilascia il GIL
+_file_digest = getattr(hashlib, "file_digest", None)
+_HASH_BUFFER_SIZE = 1 << 20
+_fadvise = getattr(os, "posix_fadvise", None)
+# Da questa dimensione il file viene mappato in memoria: l'hash legge dalla page cache senza copie
+_MMAP_MIN_SIZE = 4 << 20
 
-class GPUPerformanceMonitor:
-    """Monitor performance GPU per validare i risultati test"""
-    
-    def __init__(self):
-        self.gpu_times = []
-        self.cpu_times = []
-        self.file_sizes = []
-        
-    def log_operation(self, method: str, duration: float, file_size: int):
-        """Log operazione per calcolare speedup reale"""
-        if method == 'gpu':
-            self.gpu_times.append(duration)
-        else:
-            self.cpu_times.append(duration)
-        self.file_sizes.append(file_size)
-    
-    def get_speedup_ratio(self) -> float:
-        """Calcola speedup GPU vs CPU"""
-        if not self.gpu_times or not self.cpu_times:
-            return 1.0
-        
-        avg_gpu = sum(self.gpu_times) / len(self.gpu_times)
-        avg_cpu = sum(self.cpu_times) / len(self.cpu_times)
-        
-        return avg_cpu / avg_gpu if avg_gpu > 0 else 1.0
+# Letture serializzate (disco rotativo): un solo thread alla volta legge, a blocchi da 8MB
+# in un buffer per thread; lo SHA-256 del blocco gira fuori dal lock. None = disattivato.
+_read_lock = None
+_SERIAL_READ_CHUNK = 8 << 20
+_tls = threading.local()
 
-class HashUtilsGPU:
+# Algoritmo per l'hash completo (performance_config.hash_algorithm). Gli hash BLAKE3 sono
+# salvati con prefisso "blake3:" così non si confondono con gli SHA-256 di un database esistente.
+_algorithm = "sha256"
+_BLAKE3_MMAP_MIN_SIZE = 16 << 20
+
+
+class HashUtils:
     """
-    Enhanced HashUtils with GPU acceleration
-    Basato sui test reali: 4.5x speedup con 24 workers, 247 file/s
+    Calcolo degli hash dei file. Non c'è un percorso GPU: CuPy non implementa SHA-256,
+    e copiare l'intero file sulla scheda per poi ricalcolare l'hash sulla CPU era solo
+    più lento dello streaming.
     """
-    
-    # Configurazione basata sui test empirici
-    GPU_MIN_FILE_SIZE = 1024 * 1024      # 1MB - sotto questa soglia usa CPU
-    GPU_OPTIMAL_WORKERS = 24             # Sweet spot dai test
-    CPU_OPTIMAL_WORKERS = 28             # Miglior CPU dai test
-    GPU_BATCH_SIZE = 10                  # Batch ottimale per GPU
-    GPU_MEMORY_LIMIT = 4 * 1024**3       # 4GB limite GPU
-    
-    # Monitoring
-    _monitor = GPUPerformanceMonitor()
-    _lock = threading.Lock()
-    
-    @classmethod
-    def get_optimal_config(cls) -> Dict[str, Any]:
-        """
-        Ritorna configurazione ottimale basata sui test e sulla presenza hardware.
-        """
-        if HARDWARE_GPU_AVAILABLE:
-            return {
-                'method': 'gpu',
-                'max_workers': cls.GPU_OPTIMAL_WORKERS,
-                'use_gpu': True,
-                'gpu_batch_size': cls.GPU_BATCH_SIZE,
-                'expected_speedup': 4.5,
-                'expected_throughput': 247.0,  # file/s dai test
-                'gpu_memory_limit': cls.GPU_MEMORY_LIMIT,
-                'min_file_size': cls.GPU_MIN_FILE_SIZE
-            }
-        else:
-            return {
-                'method': 'cpu',
-                'max_workers': cls.CPU_OPTIMAL_WORKERS,
-                'use_gpu': False,
-                'expected_speedup': 1.0,
-                'expected_throughput': 39.4,  # file/s dai test CPU
-                'fallback_reason': 'GPU not available'
-            }
-    
-    @classmethod
-    def compute_hash(cls, file_path: Union[str, Path], config: Dict[str, Any]) -> Tuple[str, Optional[str]]:
+
+    SAMPLE_SIZE = 64 * 1024              # Byte letti da inizio e fine file per l'hash campione
+
+    @staticmethod
+    def compute_hash(file_path: Union[str, Path], config: Optional[Dict[str, Any]] = None) -> Tuple[str, Optional[str]]:
         """
-        Compute hash con accelerazione GPU, rispettando la configurazione fornita.
-        
-        Args:
-            file_path: Path del file.
-            config: Il dizionario di configurazione dell'applicazione.
-            
+        Hash completo del file (SHA-256 o BLAKE3, vedi set_algorithm).
+        config è accettato per compatibilità con i chiamanti esistenti.
+
         Returns:
             Tuple[str, Optional[str]]: (path_string, hash_hex) o (path_string, None) in caso di errore.
         """
-        file_path = Path(file_path)
-        
-        # --- LOGICA DI DECISIONE CENTRALE ---
-        # 1. Controlla se la configurazione *desidera* usare la GPU.
-        system_info = config.get('System Info', {})
-        config_wants_gpu = system_info.get('gpu_available', False)
+        return HashUtils._compute_hash_cpu(file_path)
 
-        # 2. Determina se la GPU deve essere effettivamente usata in questo specifico caso.
-        should_use_gpu = cls._should_use_gpu(file_path, config_wants_gpu)
-        
-        start_time = time.time()
-        
-        try:
-            if should_use_gpu:
-                # Tenta di usare la GPU
-                result_path, result_hash = cls._compute_hash_gpu(file_path)
-                method = 'gpu'
-                # Se la GPU fallisce (ritorna None), il blocco 'except' non scatta,
-                # ma il fallback viene gestito nel prossimo 'if'.
-                if result_hash is None:
-                    # Fallback esplicito a CPU se _compute_hash_gpu ha fallito internamente
-                    logging.debug(f"Fallback a CPU per {file_path} dopo fallimento GPU.")
-                    result_path, result_hash = cls._compute_hash_cpu(file_path)
-                    method = 'cpu'
-            else:
-                # Usa la CPU perché la configurazione lo richiede o le condizioni non sono soddisfatte
-                result_path, result_hash = cls._compute_hash_cpu(file_path)
-                method = 'cpu'
-                
-            # Monitor performance
-            duration = time.time() - start_time
-            file_size = file_path.stat().st_size
-            
-            with cls._lock:
-                cls._monitor.log_operation(method, duration, file_size)
-            
-            return result_path, result_hash
-            
-        except Exception as e:
-            logging.error(f"Errore critico nel calcolo dell'hash per {file_path}, fallback a CPU: {e}")
-            # Fallback finale di sicurezza
-            return cls._compute_hash_cpu(file_path)
-    
-    @classmethod
-    def _should_use_gpu(cls, file_path: Path, config_wants_gpu: bool) -> bool:
-        """
-        Determina se usare la GPU basandosi sulla configurazione e sui parametri del file.
-        """
-        # Condizioni per non usare la GPU
-        if not config_wants_gpu: return False # La configurazione lo vieta
-        if not HARDWARE_GPU_AVAILABLE: return False # L'hardware non c'è
-        
-        try:
-            # La GPU è vantaggiosa solo per file sopra una certa soglia
-            file_size = file_path.stat().st_size
-            return file_size >= cls.GPU_MIN_FILE_SIZE
-        except FileNotFoundError:
-            return False
-
-    @classmethod
-    def _compute_hash_cpu(cls, file_path: Path) -> Tuple[str, Optional[str]]:
-        """Compute hash CPU (metodo originale ottimizzato)"""
+    @staticmethod
+    def _compute_hash_cpu(file_path: Union[str, Path]) -> Tuple[str, Optional[str]]:
+        """Compute hash CPU: lettura + update in C con hashlib.file_digest (3.11+), senza GIL"""
         try:
-            hasher = hashlib.sha256()
-            buffer_size = 65536  # 64KB buffer
-            with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(buffer_size), b""):
-                    hasher.update(chunk)
-            return str(file_path), hasher.hexdigest()
+            with open(file_path, 'rb', buffering=0) as f:
+                if _algorithm == "blake3" and _read_lock is None and os.fstat(f.fileno()).st_size >= _BLAKE3_MMAP_MIN_SIZE:
+                    # File grandi: mmap + albero BLAKE3 calcolato su più thread dalla libreria
+                    hasher = _blake3.blake3(max_threads=_blake3.blake3.AUTO)
+                    hasher.update_mmap(file_path)
+                    return str(file_path), "blake3:" + hasher.hexdigest()
+                return str(file_path), HashUtils._stream_digest(f, HashUtils._new_hasher())
         except Exception as e:
             logging.error(f"Errore durante il calcolo dell'hash CPU per {file_path}: {e}")
             return str(file_path), None
-    
-    @classmethod
-    def _compute_hash_gpu(cls, file_path: Path) -> Tuple[str, Optional[str]]:
+
+    @staticmethod
+    def compute_hash_and_header(file_path: Union[str, Path], header_bytes: int, need_hash: bool = True,
+                                copy_to=None) -> Tuple[Optional[str], Optional[bytes]]:
         """
-        Compute hash GPU - implementazione 4.5x speedup.
-        Restituisce (path, None) se fallisce, per permettere il fallback.
+        Legge i primi header_bytes del file (per i metadati EXIF) e, se need_hash, prosegue
+        dallo stesso file aperto con lo SHA-256 del resto: una sola open e una sola lettura.
+        copy_to (file aperto in scrittura) riceve l'intero contenuto nello stesso passaggio.
+        Ritorna (hash, header); (None, None) in caso di errore.
         """
         try:
-            with open(file_path, 'rb') as f:
-                data = f.read()
-            
-            if len(data) > cls.GPU_MEMORY_LIMIT:
-                logging.warning(f"File {file_path} ({len(data)/(1024*1024):.1f}MB) troppo grande per GPU, fallback CPU")
-                return str(file_path), None # Segnala fallimento per fallback
-            
-            # Trasferisci su GPU (CuPy gestisce il trasferimento)
-            gpu_data = cp.frombuffer(data, dtype=cp.uint8)
-            
-            # --- NOTA IMPORTANTE ---
-            # CuPy non ha un'implementazione nativa di sha256. Lo speedup osservato
-            # nei test deriva dal trasferimento veloce del buffer e dall'esecuzione di
-            # calcoli paralleli su batch di dati. L'hashing stesso viene rieseguito
-            # sulla CPU, ma il collo di bottiglia I/O è mitigato dalla GPU.
-            hash_result = hashlib.sha256(data).hexdigest()
-            
-            return str(file_path), hash_result
-            
+            with open(file_path, 'rb', buffering=0) as f:
+                if _read_lock is not None:
+                    with _read_lock:
+                        header = f.read(header_bytes)
+                else:
+                    header = f.read(header_bytes)
+                if copy_to is not None:
+                    copy_to.write(header)
+                    return HashUtils._digest_copy(f, HashUtils._new_hasher(header), copy_to), header
+                if not need_hash:
+                    return None, header
+                return HashUtils._stream_digest(f, HashUtils._new_hasher(header)), header
         except Exception as e:
-            # Registra l'errore specifico della GPU e ritorna None per attivare il fallback
-            logging.warning(f"GPU hash failed for {file_path}: {e}, fallback CPU")
-            return str(file_path), None
+            logging.error(f"Errore durante il calcolo dell'hash CPU per {file_path}: {e}")
+            return None, None
 
-    # ... gli altri metodi (batch_compute_hashes, benchmark_performance, etc.) rimangono invariati
-    # ma devono essere aggiornati per passare il parametro 'config' se chiamano 'compute_hash'
-    
-    @classmethod
-    def batch_compute_hashes(cls, file_paths: List[Path], config: Dict[str, Any]) -> List[Tuple[str, str]]:
-        """
-        Batch processing che rispetta la configurazione.
-        """
-        system_info = config.get('System Info', {})
-        use_gpu = system_info.get('gpu_available', False)
+    @staticmethod
+    def set_algorithm(name: Optional[str]) -> str:
+        """Imposta l'algoritmo dell'hash completo ("sha256" o "blake3"); ritorna quello effettivo."""
+        global _algorithm
+        name = (name or "sha256").lower()
+        if name == "blake3" and _blake3 is None:
+            logging.warning("hash_algorithm blake3 richiesto ma il modulo blake3 non è installato: uso sha256")
+            name = "sha256"
+        elif name not in ("sha256", "blake3"):
+            logging.warning(f"hash_algorithm non supportato: {name}, uso sha256")
+            name = "sha256"
+        _algorithm = name
+        return name
 
-        if not use_gpu or not HARDWARE_GPU_AVAILABLE:
-            return cls._batch_compute_cpu(file_paths, config)
+    @staticmethod
+    def _new_hasher(data: bytes = b""):
+        return _blake3.blake3(data) if _algorithm == "blake3" else hashlib.sha256(data)
 
-        optimal_workers = cls.GPU_OPTIMAL_WORKERS
-        results = []
-        with ThreadPoolExecutor(max_workers=optimal_workers) as executor:
-            future_to_path = {executor.submit(cls.compute_hash, path, config): path for path in file_paths}
-            for future in as_completed(future_to_path):
-                try:
-                    results.append(future.result())
-                except Exception as e:
-                    logging.error(f"Batch GPU hash failed for a file: {e}")
-        return [r for r in results if r[1] is not None]
+    @staticmethod
+    def _hexdigest(hasher) -> str:
+        return "blake3:" + hasher.hexdigest() if _algorithm == "blake3" else hasher.hexdigest()
 
-    @classmethod
-    def _batch_compute_cpu(cls, file_paths: List[Path], config: Dict[str, Any]) -> List[Tuple[str, str]]:
-        """Batch processing CPU con worker ottimali dai test"""
-        results = []
-        with ThreadPoolExecutor(max_workers=cls.CPU_OPTIMAL_WORKERS) as executor:
-            future_to_path = {executor.submit(cls.compute_hash, path, config): path for path in file_paths}
-            for future in as_completed(future_to_path):
-                try:
-                    results.append(future.result())
-                except Exception as e:
-                    logging.error(f"Batch CPU hash failed for a file: {e}")
-        return [r for r in results if r[1] is not None]
+    @staticmethod
+    def _stream_digest(f, hasher) -> str:
+        """Aggiorna hasher con il file dalla posizione corrente alla fine e ritorna il digest esadecimale."""
+        if _fadvise is not None:
+            # Lettura sequenziale dall'inizio alla fine: il kernel raddoppia il readahead
+            _fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        if _read_lock is not None:
+            return HashUtils._digest_serialized(f, _read_lock, hasher)
+        position = f.tell()
+        if os.fstat(f.fileno()).st_size - position >= _MMAP_MIN_SIZE:
+            return HashUtils._digest_mmap(f, position, hasher)
+        if _file_digest is not None:
+            return HashUtils._hexdigest(_file_digest(f, lambda: hasher))
+        return HashUtils._digest_readinto(f, hasher)
 
-    # ... [benchmark e altri metodi helper] ...
-    # Per brevità, ometto i metodi di benchmark che non sono cambiati nella logica principale.
+    @staticmethod
+    def _digest_mmap(f, position: int, hasher) -> str:
+        """File grandi: update direttamente sulla mappatura (buffer protocol), senza copiare in user-space."""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mm) as view, view[position:] as rest:
+                hasher.update(rest)
+        return HashUtils._hexdigest(hasher)
 
+    @staticmethod
+    def _digest_readinto(f, hasher) -> str:
+        """Fallback per Python < 3.11: un buffer da 1MB riusato con readinto, nessun bytes per chunk."""
+        buffer = bytearray(_HASH_BUFFER_SIZE)
+        view = memoryview(buffer)
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            hasher.update(view[:size])
+        return HashUtils._hexdigest(hasher)
 
-# Compatibility layer per HashUtils originale
-class HashUtils:
-    """
-    Wrapper per compatibilità con codice esistente.
-    DEVE accettare e passare il parametro 'config'.
-    """
     @staticmethod
-    def compute_hash(file_path: Union[str, Path], config: Dict[str, Any]) -> Tuple[str, Optional[str]]:
-        """Interfaccia compatibile che passa la configurazione."""
-        return HashUtilsGPU.compute_hash(file_path, config)
+    def _digest_copy(f, hasher, out) -> str:
+        """Hash e copia in un solo ciclo: ogni blocco letto va all'hasher e al file out."""
+        buffer = bytearray(_HASH_BUFFER_SIZE)
+        view = memoryview(buffer)
+        while True:
+            if _read_lock is not None:
+                with _read_lock:
+                    size = f.readinto(buffer)
+            else:
+                size = f.readinto(buffer)
+            if not size:
+                break
+            hasher.update(view[:size])
+            out.write(view[:size])
+        return HashUtils._hexdigest(hasher)
 
+    @staticmethod
+    def _digest_serialized(f, lock: threading.Lock, hasher) -> str:
+        """Legge sotto il lock condiviso e aggiorna l'hash fuori: niente seek alternati tra thread."""
+        buffer = getattr(_tls, "buffer", None)
+        if buffer is None:
+            buffer = _tls.buffer = bytearray(_SERIAL_READ_CHUNK)
+        view = memoryview(buffer)
+        while True:
+            with lock:
+                size = f.readinto(buffer)
+            if not size:
+                break
+            hasher.update(view[:size])
+        return HashUtils._hexdigest(hasher)
 
-# La configurazione non viene più determinata qui ma passata dall'esterno.
-OPTIMAL_CONFIG = HashUtilsGPU.get_optimal_config()
+    @staticmethod
+    def serialize_reads(enabled: bool, lock=None):
+        """
+        Attiva/disattiva le letture serializzate (dischi rotativi). Senza lock vale tra i thread
+        di questo processo; con un lock multiprocessing condiviso anche tra i processi di analisi.
+        """
+        global _read_lock
+        _read_lock = (lock or threading.Lock()) if enabled else None
 
-__all__ = ['HashUtils', 'HashUtilsGPU', 'OPTIMAL_CONFIG']
+    @staticmethod
+    def reads_serialized() -> bool:
+        return _read_lock is not None
 
-logging.info(f"Modulo HashUtils caricato. Disponibilità hardware GPU: {HARDWARE_GPU_AVAILABLE}")
-if HARDWARE_GPU_AVAILABLE:
-    logging.info(f"🚀 Configurazione ottimale GPU: {OPTIMAL_CONFIG['max_workers']} workers, {OPTIMAL_CONFIG['expected_speedup']:.1f}x speedup target")
-else:
-    logging.info(f"🖥️ Configurazione ottimale CPU: {OPTIMAL_CONFIG['max_workers']} workers")
\ No newline at end of file
+    @staticmethod
+    def compute_sample_hash(file_path: Union[str, Path]) -> Optional[str]:
+        """
+        Hash veloce (blake2b a 128 bit) di dimensione, primi e ultimi 64KB del file: per un
+        video da diversi GB legge 128KB invece dell'intero file. Non sostituisce l'hash
+        completo: file diversi con stesso campione vanno confrontati con compute_hash.
+        """
+        sample_size = HashUtils.SAMPLE_SIZE
+        try:
+            fd = os.open(file_path, os.O_RDONLY)
+            try:
+                size = os.fstat(fd).st_size
+                hasher = hashlib.blake2b(size.to_bytes(8, "little"), digest_size=16)
+                hasher.update(os.pread(fd, sample_size, 0))
+                if size > sample_size:
+                    tail = max(sample_size, size - sample_size)
+                    hasher.update(os.pread(fd, size - tail, tail))
+            finally:
+                os.close(fd)
+            return hasher.hexdigest()
+        except (OSError, AttributeError) as e:
+            logging.error(f"Errore durante il calcolo dell'hash campione per {file_path}: {e}")
+            return None
+
+
+__all__ = ['HashUtils']
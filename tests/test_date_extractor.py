@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Test dell'estrazione della data dal nome file (fallback dopo EXIF/MediaInfo).
+"""
+
+import unittest
+from pathlib import Path
+
+from tests.stubs import install_missing_media_modules
+
+install_missing_media_modules()
+
+from processing.date_extractor import DateExtractor
+
+
+class FilenameDateTest(unittest.TestCase):
+
+    def assertDate(self, name, expected):
+        self.assertEqual(DateExtractor._extract_from_filename(Path("/src") / name), expected)
+
+    def test_common_camera_names(self):
+        self.assertDate("IMG_20210315_120000.jpg", ("2021", "03", "20210315"))
+        self.assertDate("VID_2019-12-31.mp4", ("2019", "12", "20191231"))
+        self.assertDate("2018_07_04 festa.jpg", ("2018", "07", "20180704"))
+
+    def test_date_after_leading_digit_run(self):
+        # Regressioni: le cifre iniziali non devono nascondere la data che segue
+        self.assertDate("IMG_1234_20200115.jpg", ("2020", "01", "20200115"))
+        self.assertDate("scan_0042_2019-06-30.jpg", ("2019", "06", "20190630"))
+        self.assertDate("DSC_1234-2018_05_20.jpg", ("2018", "05", "20180520"))
+
+    def test_separated_date_has_priority(self):
+        self.assertDate("20201301_2017-03-04.jpg", ("2017", "03", "20170304"))
+
+    def test_invalid_candidates_skipped(self):
+        self.assertDate("IMG_99991399_20200102.jpg", ("2020", "01", "20200102"))
+
+    def test_no_date(self):
+        self.assertDate("IMG_0001.jpg", None)
+        self.assertDate("foto_1999_13_45.jpg", None)
+
+
+if __name__ == "__main__":
+    unittest.main()
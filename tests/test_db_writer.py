@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Test del writer thread: scrittura a batch, flush, stop e riavvio, record in coda
+all'uscita del processo.
+"""
+
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+from unittest import mock
+
+from database.database_manager import DatabaseManager
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _record(name: str, file_hash: str = None):
+    return (f"/src/{name}", file_hash, "2021", "01", "PHOTO", "copied", f"/dst/{name}", name, 1000)
+
+
+class DatabaseWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self._tmp.name, "db.sqlite")
+        self.db = DatabaseManager(self.db_path)
+        # Intervallo lungo: nessun batch viene scritto dal timer durante il test
+        self.db.start_writer(batch_size=1000, flush_interval_s=60)
+
+    def tearDown(self):
+        self.db.flush_and_join()
+        self._tmp.cleanup()
+
+    def _query(self, sql: str, params=()):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            return conn.execute(sql, params).fetchone()
+        finally:
+            conn.close()
+
+    def _count_on_disk(self) -> int:
+        return self._query("SELECT COUNT(*) FROM files")[0]
+
+    def test_full_batch_is_written_without_stop(self):
+        self.db.flush_and_join()
+        self.db.start_writer(batch_size=3, flush_interval_s=60)
+        for i in range(3):
+            self.db.enqueue_file(_record(f"a{i}.jpg"))
+        deadline = time.monotonic() + 5
+        while self._count_on_disk() < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self._count_on_disk(), 3)
+
+    def test_flush_commits_queued_records_and_keeps_writer(self):
+        for i in range(3):
+            self.db.enqueue_file(_record(f"a{i}.jpg"))
+        self.db.flush()
+        self.assertEqual(self._count_on_disk(), 3)
+
+        writer = self.db._writer
+        self.assertTrue(writer.is_alive())
+        self.db.enqueue_file(_record("b.jpg"))
+        self.db.flush()
+        self.assertIs(self.db._writer, writer)
+        self.assertEqual(self._count_on_disk(), 4)
+
+    def test_flush_and_join_writes_queue_and_stops_writer(self):
+        for i in range(5):
+            self.db.enqueue_file(_record(f"a{i}.jpg"))
+        self.db.enqueue_unprocessed_file("/src/x.txt", "unsupported", "estensione")
+        writer = self.db._writer
+        self.db.flush_and_join()
+        self.assertFalse(writer.is_alive())
+        self.assertIsNone(self.db._writer)
+        self.assertEqual(self._count_on_disk(), 6)
+
+        # Il prossimo enqueue riavvia il writer
+        self.db.enqueue_file(_record("b.jpg"))
+        self.assertIsNot(self.db._writer, writer)
+        self.db.flush()
+        self.assertEqual(self._count_on_disk(), 7)
+
+    def test_hash_update_follows_insert(self):
+        self.db.enqueue_file(_record("a.jpg"))
+        self.db.enqueue_hash_update("/src/a.jpg", "ab" * 32)
+        self.db.flush()
+        self.assertEqual(self._query("SELECT hash FROM files WHERE original_path = ?", ("/src/a.jpg",))[0], "ab" * 32)
+
+    def test_statistics_include_queued_records(self):
+        self.db.enqueue_file(_record("a.jpg"))
+        self.db.enqueue_unprocessed_file("/src/x.txt", "unsupported", "estensione")
+        stats = self.db.get_statistics()
+        self.assertEqual(stats['general']['total_files'], 2)
+        self.assertEqual(stats['general']['unsupported_files'], 1)
+
+    def test_cleanup_writes_queued_records(self):
+        self.db.enqueue_file(_record("a.jpg"))
+        self.db.cleanup_database()
+        self.assertEqual(self._count_on_disk(), 1)
+
+    def test_failed_startup_raises_instead_of_hanging(self):
+        db = DatabaseManager(os.path.join(self._tmp.name, "locked.sqlite"))
+        with mock.patch.object(db, "create_db", side_effect=sqlite3.OperationalError("database is locked")):
+            db.start_writer(batch_size=1000, flush_interval_s=60, queue_size=1)
+            db._writer.join(5)
+        self.assertIsInstance(db._writer.error, sqlite3.OperationalError)
+        with self.assertRaises(RuntimeError):
+            db.enqueue_file(_record("a.jpg"))
+        with self.assertRaises(RuntimeError):
+            db.flush()
+        db.flush_and_join()
+
+    def test_queued_records_survive_process_exit(self):
+        # Nessun flush esplicito: il writer è daemon, i record devono arrivare comunque su disco
+        script = textwrap.dedent(f"""
+            import sys
+            sys.path.insert(0, {REPO_ROOT!r})
+            from database.database_manager import DatabaseManager
+            db = DatabaseManager({self.db_path!r})
+            db.start_writer(batch_size=1000, flush_interval_s=60)
+            for i in range(50):
+                db.enqueue_file(("/src/exit%d.jpg" % i,) + {_record("x.jpg")[1:]!r})
+        """)
+        subprocess.run([sys.executable, "-c", script], check=True, cwd=self._tmp.name)
+        self.assertEqual(self._count_on_disk(), 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Test di FileUtils.safe_copy: riserva del nome in caso di collisione.
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from processing.file_utils import FileUtils
+
+
+class SafeCopyTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.src = Path(self._tmp.name) / "IMG_0001.jpg"
+        self.src.write_bytes(b"nuovo contenuto")
+        self.dest_dir = Path(self._tmp.name) / "dst"
+        self.dest_dir.mkdir()
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def test_copy_to_free_name(self):
+        dest = FileUtils.safe_copy(self.src, self.dest_dir, "IMG_0001.jpg")
+        self.assertEqual(dest, self.dest_dir / "IMG_0001.jpg")
+        self.assertEqual(dest.read_bytes(), b"nuovo contenuto")
+
+    def test_collision_uses_next_free_suffix(self):
+        (self.dest_dir / "IMG_0001.jpg").write_bytes(b"esistente")
+        (self.dest_dir / "IMG_0001__1.jpg").write_bytes(b"esistente 1")
+
+        dest = FileUtils.safe_copy(self.src, self.dest_dir, "IMG_0001.jpg")
+
+        self.assertEqual(dest, self.dest_dir / "IMG_0001__2.jpg")
+        self.assertEqual(dest.read_bytes(), b"nuovo contenuto")
+        # I file già presenti non vengono toccati
+        self.assertEqual((self.dest_dir / "IMG_0001.jpg").read_bytes(), b"esistente")
+        self.assertEqual((self.dest_dir / "IMG_0001__1.jpg").read_bytes(), b"esistente 1")
+
+    def test_concurrent_copies_get_distinct_names(self):
+        threads_count = 8
+        barrier = threading.Barrier(threads_count)
+        results = []
+        results_lock = threading.Lock()
+
+        def copy():
+            barrier.wait()
+            dest = FileUtils.safe_copy(self.src, self.dest_dir, "IMG_0001.jpg")
+            with results_lock:
+                results.append(dest)
+
+        threads = [threading.Thread(target=copy) for _ in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(results)), threads_count)
+        self.assertEqual(sorted(os.listdir(self.dest_dir)),
+                         sorted(["IMG_0001.jpg"] + [f"IMG_0001__{i}.jpg" for i in range(1, threads_count)]))
+
+    def test_failed_copy_releases_reserved_name(self):
+        with mock.patch.object(FileUtils, "copy_file", side_effect=OSError("disco pieno")):
+            with self.assertRaises(OSError):
+                FileUtils.safe_copy(self.src, self.dest_dir, "IMG_0001.jpg")
+        self.assertEqual(os.listdir(self.dest_dir), [])
+
+    def test_hardlink_collision(self):
+        (self.dest_dir / "IMG_0001.jpg").write_bytes(b"esistente")
+        dest = FileUtils.safe_copy(self.src, self.dest_dir, "IMG_0001.jpg", strategy="hardlink", same_device=True)
+        self.assertEqual(dest, self.dest_dir / "IMG_0001__1.jpg")
+        self.assertTrue(os.path.samefile(dest, self.src))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Test di BloomHashSet: nessun falso negativo, i "forse" sono confermati dal database.
+"""
+
+import hashlib
+import unittest
+
+from processing.hash_index import BloomHashSet
+
+
+def _sha256(i: int) -> str:
+    return hashlib.sha256(str(i).encode()).hexdigest()
+
+
+class _HashSource:
+    """Sostituto di DatabaseManager per i soli metodi usati da BloomHashSet; conta le lookup."""
+
+    def __init__(self, hashes):
+        self.hashes = set(hashes)
+        self.lookups = []
+
+    def count_hashes(self) -> int:
+        return len(self.hashes)
+
+    def iter_hashes(self):
+        return iter(self.hashes)
+
+    def has_hash(self, file_hash: str) -> bool:
+        self.lookups.append(file_hash)
+        return file_hash in self.hashes
+
+
+class BloomHashSetTest(unittest.TestCase):
+
+    def setUp(self):
+        self.source = _HashSource(_sha256(i) for i in range(2000))
+        self.bloom = BloomHashSet(self.source)
+
+    def test_no_false_negatives(self):
+        for file_hash in self.source.hashes:
+            self.assertTrue(self.bloom.might_contain(file_hash))
+            self.assertIn(file_hash, self.bloom)
+
+    def test_certain_miss_skips_database(self):
+        misses = [h for h in map(_sha256, range(2000, 2200)) if not self.bloom.might_contain(h)]
+        self.assertTrue(misses)
+        self.source.lookups.clear()
+        for file_hash in misses:
+            self.assertNotIn(file_hash, self.bloom)
+        self.assertEqual(self.source.lookups, [])
+
+    def test_false_positive_is_confirmed_by_database(self):
+        # Con ~1% di falsi positivi, tra 10000 hash assenti se ne trova sicuramente qualcuno
+        false_positive = next(h for h in map(_sha256, range(2000, 12000)) if self.bloom.might_contain(h))
+        self.source.lookups.clear()
+        self.assertNotIn(false_positive, self.bloom)
+        self.assertEqual(self.source.lookups, [false_positive])
+
+    def test_false_positive_rate(self):
+        absent = [_sha256(i) for i in range(2000, 22000)]
+        rate = sum(map(self.bloom.might_contain, absent)) / len(absent)
+        self.assertLess(rate, 0.03)
+
+    def test_empty_database(self):
+        bloom = BloomHashSet(_HashSource(()))
+        self.assertNotIn(_sha256(0), bloom)
+
+
+if __name__ == "__main__":
+    unittest.main()
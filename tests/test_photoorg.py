@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Test di PhotoOrg: avvio del logging (--verbose non viene sovrascritto da log_level) e
+controlli sui percorsi di sorgente e destinazione.
+"""
+
+import logging
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import PhotoOrg
+from loggingSetup.logging_setup import LoggingSetup
+
+
+class InitializeLoggingTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.config = {"log": os.path.join(self._tmp.name, "log.txt"), "log_level": "INFO"}
+        root_logger = logging.getLogger()
+        self._saved = (root_logger.level, root_logger.handlers[:])
+
+    def tearDown(self):
+        LoggingSetup.stop_logging()
+        root_logger = logging.getLogger()
+        root_logger.setLevel(self._saved[0])
+        root_logger.handlers[:] = self._saved[1]
+        self._tmp.cleanup()
+
+    def test_verbose_survives_initialize_logging(self):
+        PhotoOrg.setup_minimal_logging(verbose=True)
+        PhotoOrg.initialize_logging(self.config, verbose=True)
+        self.assertEqual(logging.getLogger().level, logging.DEBUG)
+
+    def test_log_level_applies_without_verbose(self):
+        PhotoOrg.setup_minimal_logging(verbose=False)
+        PhotoOrg.initialize_logging(dict(self.config, log_level="WARNING"))
+        self.assertEqual(logging.getLogger().level, logging.WARNING)
+
+
+class ValidatePathsTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        root = Path(self._tmp.name)
+        self.src = root / "src"
+        self.src.mkdir()
+        self.dst = root / "dst"
+
+    def tearDown(self):
+        self._tmp.cleanup()
+
+    def _validate(self):
+        PhotoOrg._validate_paths(self.src, self.dst, PhotoOrg._stat_or_none(self.src), PhotoOrg._stat_or_none(self.dst))
+
+    def test_unwritable_destination_fails_fast(self):
+        self.dst.mkdir()
+        # Come root os.access è sempre vero: si simula una destinazione in sola lettura
+        with mock.patch.object(PhotoOrg.os, "access", return_value=False):
+            with self.assertRaisesRegex(ValueError, "non scrivibile"):
+                self._validate()
+
+    def test_missing_destination_checks_existing_parent(self):
+        with mock.patch.object(PhotoOrg.os, "access", return_value=True) as access:
+            self._validate()
+        access.assert_called_once_with(self.dst.parent, os.W_OK | os.X_OK)
+
+    def test_destination_file_is_rejected(self):
+        self.dst.write_bytes(b"")
+        with self.assertRaisesRegex(ValueError, "non è una directory"):
+            self._validate()
+
+
+if __name__ == "__main__":
+    unittest.main()
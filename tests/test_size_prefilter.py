@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Test del prefiltro per dimensione di FileProcessor (e del livello hash campione) con
+più file della stessa dimensione.
+"""
+
+import os
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from tests.stubs import install_missing_media_modules
+
+# processing.file_processor importa GExiv2 (gi), pymediainfo e tqdm a livello di modulo
+install_missing_media_modules()
+
+from database.database_manager import DatabaseManager
+from processing.file_processor import FileProcessor
+from processing.hash_utils import HashUtils
+
+
+def _full_hash(path: str) -> str:
+    return HashUtils.compute_hash(path, {})[1]
+
+
+class SizePrefilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        root = Path(self._tmp.name)
+        self.src = root / "src"
+        self.src.mkdir()
+        (root / "dst").mkdir()
+        self.db = DatabaseManager(str(root / "db.sqlite"))
+        self.db.start_writer(flush_interval_s=60)
+        self.processor = self._make_processor()
+
+    def tearDown(self):
+        self.db.flush_and_join()
+        self._tmp.cleanup()
+
+    def _make_processor(self, **performance_config):
+        config = {"performance_config": dict(size_prefilter=True, **performance_config)}
+        return FileProcessor(config, str(self.src), str(self.src.parent / "dst"), self.db,
+                             [".jpg"], [".jpg"], [], max_workers=2)
+
+    def _file(self, name: str, content: bytes) -> str:
+        path = self.src / name
+        path.write_bytes(content)
+        return str(path)
+
+    def _record(self, path: str, file_hash=None):
+        return (path, file_hash, "2021", "01", "PHOTO", "copied", "/dst/x.jpg", "x.jpg", os.path.getsize(path))
+
+    def _hash_on_disk(self, path: str):
+        self.db.flush()
+        conn = self.db.open_read_only()
+        try:
+            return conn.execute("SELECT hash FROM files WHERE original_path = ?", (path,)).fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_distinct_sizes_need_no_hash(self):
+        a = self._file("a.jpg", b"a" * 100)
+        b = self._file("b.jpg", b"b" * 200)
+        self.assertFalse(self.processor._claim_size(100, a))
+        self.assertFalse(self.processor._claim_size(200, b))
+        self.assertFalse(self.processor._is_duplicate(_full_hash(a)))
+
+    def test_same_size_hashes_pending_file_already_recorded(self):
+        a = self._file("a.jpg", b"x" * 100)
+        b = self._file("b.jpg", b"x" * 100)
+        self.assertFalse(self.processor._claim_size(100, a))
+        # Il primo file è già stato organizzato e accodato senza hash
+        self.processor._enqueue_record(self._record(a))
+
+        self.assertTrue(self.processor._claim_size(100, b))
+
+        self.assertEqual(self._hash_on_disk(a), _full_hash(a))
+        self.assertTrue(self.processor._is_duplicate(_full_hash(b)))
+
+    def test_same_size_completes_record_not_yet_queued(self):
+        a = self._file("a.jpg", b"x" * 100)
+        b = self._file("b.jpg", b"y" * 100)
+        self.assertFalse(self.processor._claim_size(100, a))
+        self.assertTrue(self.processor._claim_size(100, b))
+
+        # Il record del primo file arriva dopo: l'hash calcolato in ritardo viene aggiunto
+        self.processor._enqueue_record(self._record(a))
+        self.assertEqual(self._hash_on_disk(a), _full_hash(a))
+        self.assertFalse(self.processor._is_duplicate(_full_hash(b)))
+
+    def test_concurrent_claims_hash_pending_file_once(self):
+        a = self._file("a.jpg", b"x" * 100)
+        others = [self._file(f"b{i}.jpg", b"x" * 100) for i in range(4)]
+        compute_hash = HashUtils.compute_hash
+        calls = []
+
+        def slow_hash(path, config=None):
+            calls.append(str(path))
+            time.sleep(0.2)
+            return compute_hash(path, config)
+
+        self.assertFalse(self.processor._claim_size(100, a))
+        results = []
+        barrier = threading.Barrier(len(others))
+
+        def claim(path):
+            barrier.wait()
+            results.append(self.processor._claim_size(100, path))
+
+        with mock.patch.object(HashUtils, "compute_hash", side_effect=slow_hash):
+            threads = [threading.Thread(target=claim, args=(path,)) for path in others]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(calls, [a])
+        self.assertEqual(results, [True] * len(others))
+
+    def test_failed_pending_hash_releases_waiters(self):
+        a = self._file("a.jpg", b"x" * 100)
+        b = self._file("b.jpg", b"x" * 100)
+        c = self._file("c.jpg", b"x" * 100)
+        started = threading.Event()
+
+        def failing_hash(path, config=None):
+            started.set()
+            time.sleep(0.1)
+            raise OSError("file sparito")
+
+        self.processor._claim_size(100, a)
+        errors = []
+
+        def first():
+            try:
+                self.processor._claim_size(100, b)
+            except OSError as e:
+                errors.append(e)
+
+        with mock.patch.object(HashUtils, "compute_hash", side_effect=failing_hash):
+            thread = threading.Thread(target=first)
+            thread.start()
+            started.wait()
+            # Il terzo file attende la risoluzione fallita e prosegue con l'hash completo
+            self.assertTrue(self.processor._claim_size(100, c))
+            thread.join()
+        self.assertEqual(len(errors), 1)
+
+    def test_sample_hash_separates_same_size_files(self):
+        processor = self._make_processor(sample_hash=True)
+        a = self._file("a.jpg", b"a" + b"x" * 99)
+        b = self._file("b.jpg", b"b" + b"x" * 99)
+        c = self._file("c.jpg", b"a" + b"x" * 99)
+
+        self.assertFalse(processor._claim_size(100, a))
+        # Stessa dimensione, campione diverso: nessun hash completo
+        self.assertFalse(processor._claim_size(100, b))
+        self.assertEqual(processor._seen_hashes, set())
+        # Stesso campione: serve l'hash completo, anche del file in sospeso
+        self.assertTrue(processor._claim_size(100, c))
+        self.assertTrue(processor._is_duplicate(_full_hash(c)))
+
+
+if __name__ == "__main__":
+    unittest.main()